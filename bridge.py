@@ -2,12 +2,11 @@ import sys
 import time
 import argparse
 import traceback
-import pysftp
-import paramiko
 import logging
-from os import listdir
-from os.path import basename, splitext
+from os import listdir, remove
+from os.path import basename, isdir, splitext
 from datetime import datetime
+from threading import Lock
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
@@ -15,8 +14,13 @@ import core.config as config
 from core.io.stdout import StdOut
 from core.io.files import get_context, trim_extension
 from core.io.logger import SimpleColorFormatter
+from core.io.pipeline import EventPipeline
+from core.io.batch import BatchConverter
+from core.io.sftp import SFTPSession
 from core.cli.colors import Col
 from core.lib.xrns import XRNS
+from core.lib.cache import ConversionCache
+from core.lib.zss import SnapshotDiff, read_riff
 from core.audio.sequencer import Sequencer
 
 logger = logging.getLogger(__name__)
@@ -26,41 +30,48 @@ ch.setFormatter(SimpleColorFormatter())
 logger.addHandler(ch)
 logger.setLevel(logging.INFO)
 debug = False
+# changes of a conversion listed (the rest only in debug mode)
+DIFF_LINES = 20
 
 
-class Connection(pysftp.Connection):
+class Connection(SFTPSession):
     def __init__(self):
-        super().__init__(host=config.SFTP_HOST, username=config.SFTP_USER,
-                         password=config.SFTP_PASSWORD)
+        super().__init__(config.SFTP_HOST, config.SFTP_USER,
+                         config.SFTP_PASSWORD, port=config.SFTP_PORT,
+                         keepalive=config.SFTP_KEEPALIVE,
+                         timeout=config.SFTP_TIMEOUT,
+                         backoff=config.SFTP_BACKOFF,
+                         known_hosts=config.SFTP_KNOWN_HOSTS,
+                         accept_new_host=config.SFTP_ACCEPT_NEW_HOST)
 
     def upload(self, src_path, dest_path, snapshot_folder):
         folder = config.PATH_ZSS_REMOTE + snapshot_folder
         if not self.exists(folder):
             logger.info(f"Specified snapshot folder '{snapshot_folder}' " +
                         f"does not exist. Creating.")
-            self.mkdir(folder)
+            self.makedirs(folder)
         try:
-            self.put(src_path, dest_path, preserve_mtime=True)
+            uploaded = self.put(src_path, dest_path)
         except FileNotFoundError:
             logger.error(f'Bad target "{dest_path}"')
             return False
-        logger.warning(
-            f'ZSS uploaded to snapshot folder {snapshot_folder}.')
+        if uploaded:
+            logger.warning(
+                f'ZSS uploaded to snapshot folder {snapshot_folder}.')
+        else:
+            logger.info('ZSS on zynthian is up to date. Upload skipped.')
+        return True
 
     def get_remote_file(self, src_path, dest_path):
-        if self.exists(src_path):
-            self.get(src_path, dest_path)
-            return True
-        else:
-            return False
+        return self.get(src_path, dest_path)
 
 
 class WatchDog:
     def __init__(self):
         self.observer = Observer()
 
-    def run(self, callback):
-        event_handler = FileChangeHandler(callback)
+    def run(self, pipeline):
+        event_handler = FileChangeHandler(pipeline.submit)
         self.observer.schedule(
             event_handler, config.PATH_XRNS, recursive=True)
         self.observer.start()
@@ -72,6 +83,7 @@ class WatchDog:
             print("Watchdog stopped.")
 
         self.observer.join()
+        pipeline.shutdown()
 
 
 class FileChangeHandler(FileSystemEventHandler):
@@ -88,31 +100,44 @@ class FileChangeHandler(FileSystemEventHandler):
                 name = splitext(basename(event.src_path))[0]
                 current_time = datetime.now().strftime("%H:%M:%S")
                 logger.info(f'Project {name} was modified at {current_time}')
-                time.sleep(1.5)
-                self.callback(name, config.SFTP_DEFAULT_SNAPSHOT)
+                self.callback(name)
 
 
 class App:
     def __init__(self) -> None:
         self.context = get_context()
         self.connected = False
+        self.conn = Connection()
         self.stdout = StdOut()
         self.stdout.mute()
         self.seq = Sequencer()
         self.stdout.unmute()
-        self.xrns = XRNS()
+        self.xrns = XRNS(lazy=True)
+        self.cache = None
+        self.converted = None
+        self.initialized = False
+        self.lock = Lock()
+        # the local ZSS and its cache are shared by conversion and upload
+        self.file_lock = Lock()
 
     def parse_args(self, args=None):
         parser = argparse.ArgumentParser()
         print('Renoise-Zynthian 🎵 bridge by danielwine')
         logger.info('zynseq library (c) by Brian Walton')
         print()
-        parser.add_argument('filename', type=str, nargs='?')
+        parser.add_argument('filename', type=str, nargs='?',
+                            help='Project (.xrns), instrument (.xrni) '
+                            'or folder of instruments')
         parser.add_argument('--list', action='store_true',
                             help='Lists projects in standard library')
         parser.add_argument('--upload', dest='upload_path', metavar="PATH",
                             type=str,
                             help='Specify remote snapshot subfolder')
+        parser.add_argument('--batch', metavar='DIR', type=str,
+                            help='Converts every project of a folder')
+        parser.add_argument('--workers', type=int,
+                            default=config.BATCH_WORKERS,
+                            help='Number of processes used by --batch')
         parser.add_argument('--debug', action='store_true',
                             help='Switch debug mode on (unhides stdout)')
         if len(sys.argv) == 1:
@@ -128,20 +153,7 @@ class App:
             logger.info(' ', file)
 
     def connect(self):
-        success = False
-        reconnect_delay = 5
-        while not success:
-            try:
-                err = f'Your zynthian cannot be reached at {config.SFTP_HOST}'
-                self.conn = Connection()
-                success = True
-            except pysftp.exceptions.ConnectionException:
-                logger.error(f'Timeout. {err}')
-            except paramiko.ssh_exception.SSHException:
-                logger.error(f'No route to host. {err}')
-            if not success:
-                time.sleep(reconnect_delay)
-                logger.info(f'Reconnecting in {reconnect_delay} seconds.')
+        self.conn.connect()
         print()
         logger.warning(f'Connection to zynthian established.')
         self.connected = True
@@ -153,36 +165,80 @@ class App:
 
     def load(self, file):
         try:
-            self.xrns.load(file)
+            if isdir(file) or isdir(f'{config.PATH_XRNS}/{file}'):
+                folder = file if isdir(file) else f'{config.PATH_XRNS}/{file}'
+                if not self.xrns.load_library(folder):
+                    self.leave(file)
+            else:
+                self.xrns.load(file)
         except FileNotFoundError:
             try:
                 self.xrns.load(file, standard_path=False)
             except FileNotFoundError:
                 self.leave(file)
 
+        name = self.xrns.source.project_name
+        self.cache = ConversionCache(name)
+        incremental = self.restore(name, self.get_local_path())
         if not debug:
             self.stdout.mute()
-        self.seq.initialize(self.context['path_lib'], scan=False, debug=debug)
+        if not self.initialized:
+            self.seq.initialize(scan=False, debug=debug)
+            self.initialized = True
         try:
-            self.seq.import_project(file, self.xrns.project)
+            self.seq.import_project(
+                file, self.xrns.project, cache=self.cache,
+                incremental=incremental)
+            self.converted = name
         except Exception as e:
+            self.converted = None
             self.stdout.unmute()
             logger.critical('Unable to import project. An error occured.')
             print(traceback.format_exception_only(e)[0], end='')
             exit()
         self.stdout.unmute()
 
-    def update(self, local_path, remote_path, snapshot_folder=''):
+    def restore(self, name, local_path):
+        ''' checks whether the sequencer holds the previous conversion of
+            the project (restores it from the local ZSS if possible) '''
+        if self.converted == name:
+            return True
+        self.converted = None
+        if self.cache.is_bound(local_path):
+            return self.seq.load_snapshot(local_path)
+        return False
+
+    def get_local_path(self):
+        return self.xrns.get_original_path() + '.zss'
+
+    def update(self, local_path, remote_path, cache, snapshot_folder=''):
+        ''' puts the converted sequences into the remote snapshot (keeping
+            its other parts) and uploads it. only the local ZSS is used,
+            the sequencer may convert the next project meanwhile '''
+        remote_copy = local_path + '.remote'
         success = False
         while not success:
-            if self.conn.get_remote_file(remote_path, local_path):
+            if self.conn.get_remote_file(remote_path, remote_copy):
+                remote_riff = read_riff(remote_copy)
+                local_riff = read_riff(local_path)
+                # without both RIFF data there is nothing to compare
+                if remote_riff is not None and local_riff is not None and \
+                        not SnapshotDiff(remote_riff, local_riff):
+                    remove(remote_copy)
+                    logger.info('ZSS on zynthian is up to date. '
+                                'Upload skipped.')
+                    return
                 logger.info(f'Project found on server. Updating...')
-                self.seq.load_snapshot(local_path, load_sequence=False)
-            self.seq.save_file(file_path=local_path)
+                with self.file_lock:
+                    self.seq.merge_snapshot(remote_copy, local_path,
+                                            riff_path=local_path)
+                    cache.bind(local_path)
+                    cache.save()
+                remove(remote_copy)
             try:
                 self.conn.upload(local_path, remote_path, snapshot_folder)
                 success = True
-            except OSError:
+            except (OSError, EOFError):
                 logger.error('Connection lost.')
                 self.connect()
 
@@ -194,26 +250,84 @@ class App:
         logger.info(f'  total sequences: {project.get_total_phrases()}')
         logger.info(f'  transposed sequences: ' +
                     f'{project.get_transposable_phrases() * 16}')
+        if self.seq.incremental:
+            logger.info(f'  unchanged groups (skipped): {self.seq.skipped}')
+        if self.seq.shared:
+            logger.info(f'  shared patterns: {self.seq.shared} '
+                        f'({self.seq.shared_events} events not stored)')
+
+    def print_changes(self, diff):
+        if not diff:
+            logger.info('  no changes since the last conversion')
+            return
+        logger.info(f'  changes since the last conversion: {len(diff)}')
+        lines = diff.get_report()
+        for line in lines[:DIFF_LINES]:
+            logger.info(f'    {line}')
+        for line in lines[DIFF_LINES:]:
+            logger.debug(f'    {line}')
+        if len(lines) > DIFF_LINES and not debug:
+            logger.info(f'    ... ({len(lines) - DIFF_LINES} more)')
 
     def leave(self, filename):
         logger.error(f'Missing file: {filename}')
         self.list_files()
         exit()
 
-    def process(self, filename, upload_path):
-        self.load(filename)
-        self.print_statistics()
-
-        local_path = self.xrns.get_original_path() + '.zss'
+    def convert(self, filename):
+        with self.lock:
+            self.load(filename)
+            self.print_statistics()
+            local_path = self.get_local_path()
+            cache = self.cache
+            with self.file_lock:
+                previous = read_riff(local_path)
+                self.seq.save_file(file_path=local_path)
+                cache.bind(local_path)
+                cache.save()
+            if previous is None:
+                logger.info('  no previous conversion to compare with')
+            else:
+                current = self.seq.get_riff_data()
+                if current is not None:
+                    self.print_changes(SnapshotDiff(previous, current))
+        return local_path, cache
+
+    def upload(self, local_path, cache, upload_path):
         remote_path = f'{config.PATH_ZSS_REMOTE}{upload_path}'
         remote_path += f'/{trim_extension(local_path.split("/")[-1])}.zss'
+        if not self.connected:
+            self.connect()
+        self.update(local_path, remote_path, cache,
+                    snapshot_folder=upload_path)
+
+    def deliver(self, name, result):
+        self.upload(*result, config.SFTP_DEFAULT_SNAPSHOT)
 
-        self.seq.save_file(file_path=local_path)
+    def process(self, filename, upload_path):
+        result = self.convert(filename)
         if upload_path is not None:
-            if not self.connected:
-                self.connect()
-            self.update(local_path, remote_path,
-                        snapshot_folder=upload_path)
+            self.upload(*result, upload_path)
+
+    def batch(self, folder, workers):
+        converter = BatchConverter(workers)
+        logger.info(f'Converting projects in {folder}...')
+        try:
+            converter.run(folder, callback=self.report)
+        except NotADirectoryError:
+            logger.error(f'Missing folder: {folder}')
+            return False
+        for line in converter.get_report():
+            logger.info(line)
+        return not converter.failures
+
+    def report(self, result):
+        name = result['file'].split('/')[-1]
+        if result['error']:
+            logger.error(f"{name}: {result['error']}")
+        else:
+            logger.info(f"{name} converted in "
+                        f"{result['time'] * 1000:.1f} ms.")
 
     def run(self):
         global debug
@@ -221,13 +335,18 @@ class App:
         if self.p_args and self.p_args.debug:
             logger.setLevel(logging.DEBUG)
             debug = True
+        if self.p_args and self.p_args.batch:
+            self.batch(self.p_args.batch, self.p_args.workers)
+            return
         if not self.p_args or (not self.p_args.filename and self.p_args.debug):
             print(f'{Col.CYAN}Type -h to see argument options.')
             print(f'No arguments specified. Entering watch mode.')
             self.connect()
             print(f'Watching for changes in {config.PATH_XRNS}...')
             watch = WatchDog()
-            watch.run(self.process)
+            watch.run(EventPipeline(self.convert, self.deliver,
+                                    delay=config.WATCH_DELAY,
+                                    workers=config.CONVERT_WORKERS))
         else:
             self.process(self.p_args.filename, self.p_args.upload_path)
         self.disconnect()
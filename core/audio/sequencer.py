@@ -1,18 +1,25 @@
 import time
-from math import sqrt
+from collections import Counter
 from os.path import dirname, realpath
 from logging import DEBUG, INFO
 from core.config import (
     auto_bank, minimum_rows, maximum_rows,
-    trigger_channel, trigger_start_note, PATH_ZSS)
+    trigger_channel, trigger_start_note, share_patterns, PATH_ZSS)
 from core.io.utils import trim_extension
 from core.io.logger import LoggerFactory
 from core.lib.tracker import Note, TrackerPattern
+from core.lib.scales import TRANSPOSITIONS, get_offsets, is_chromatic
+from core.lib.layout import BankLayout
 from core.lib.zss import SnapshotManager
+from core.lib.riff import (
+    ZynseqFile, NOTE_ON, parse_pattern_file, pattern_to_file)
 from core.lib.zynseq.zynseq.zynseq import zynseq
 from core.audio.manipulator import Manipulator
 
 basepath = dirname(realpath(__file__))
+DEFAULT_BEATS = 4
+DEFAULT_TEMPO = 120
+DEFAULT_BEATS_PER_BAR = 4
 logger, lf = LoggerFactory(__name__)
 
 
@@ -22,85 +29,213 @@ class Sequencer(zynseq, SnapshotManager):
         self.man = Manipulator(self.libseq)
         self.filepath = ""
         self.file = ""
+        self.incremental = False
+        self.skipped = 0
+        self.usage = None
+        self.usage_changes = None
+        self.pattern_keys = {}
+        self.pattern_refs = Counter()
+        self.shared = 0
+        self.shared_events = 0
 
     def initialize(self, scan=True, debug=False):
         logger.setLevel(DEBUG if debug else INFO)
-        self.pattern = PatternManager(self.libseq)
+        self.pattern = PatternManager(self.libseq, self)
         if scan:
             self.get_statistics()
         self.pattern.select(self.libseq.getPatternAt(1, 0, 0, 0))
         self.libseq.togglePlayState(1, 0)
 
-    def import_project(self, file_name, tracker_project):
+    def reset(self):
+        ''' clears banks and patterns of the library (and restores the
+            default tempo) without initializing it again '''
+        # loading without a file only clears the sequence manager
+        self.load('')
+        self.libseq.setTempo(DEFAULT_TEMPO)
+        self.libseq.setBeatsPerBar(DEFAULT_BEATS_PER_BAR)
+        self.converted = {}
+        self.skipped = 0
+        # the patterns shared by the previous conversion are gone
+        self.pattern_keys = {}
+        self.pattern_refs = Counter()
+        self.shared = 0
+        self.shared_events = 0
+
+    def import_project(self, file_name, tracker_project, cache=None,
+                       incremental=False, statistics=False):
+        ''' imports the groups of a tracker project. with a conversion
+            cache, groups with unchanged phrases reuse their cached streams.
+            if incremental is set (the sequencer already holds the previous
+            conversion of the same project), they are not imported at all.
+            the statistics are only collected again if requested '''
         self.tracker = tracker_project
         info = self.tracker.info
-        self.load('')
+        layout = self.tracker.get_layout()
+        self.cache = cache
+        self.incremental = incremental and cache is not None and (
+            cache.layout == layout)
+        if not self.incremental:
+            self.reset()
+        self.converted = {}
+        self.skipped = 0
         self.libseq.setTempo(int(info['bpm']))
         self.file = file_name
 
-        bank = 1
-        self.select_bank(bank)
-        self._import_groups(bank)
-        self.get_statistics()
-
-    def _get_tracker_sequences(self):
-        return len([phrase for group in self.tracker.get_groups()
-                    for phrase in group.phrases if
-                    not group.name.startswith('*')])
-
-    def _expand_bank(self, bank, sequences):
-        current_sequences = self.libseq.getSequencesInBank(bank)
-        new_sequences = current_sequences
-        sqrts = sqrt(sequences)
-        if sequences > current_sequences:
-            rows = int(sqrts) + 1
-            rows = rows if rows <= maximum_rows else maximum_rows
-            rows = rows if rows >= minimum_rows else minimum_rows
-            new_sequences = rows * rows
-            self.libseq.setSequencesInBank(bank, new_sequences)
-        print(new_sequences, sqrts, int(sqrts), sequences, current_sequences)
-        return new_sequences
+        self.select_bank(1)
+        self._count_pattern_refs()
+        self._import_groups()
+        if self.shared:
+            self.libseq.cleanPatterns()
+        if cache is not None:
+            cache.update(layout, self.converted)
+        if statistics:
+            self.get_statistics()
+
+    def _count_pattern_refs(self):
+        ''' sequences referencing each pattern. a fresh library only has
+            patterns of their own (patterns missing here count as one) '''
+        self.pattern_keys = {}
+        self.pattern_refs = Counter()
+        self.shared = 0
+        self.shared_events = 0
+        if not self.incremental:
+            return
+        for bank in range(1, 65):
+            for sequence in range(self.libseq.getSequencesInBank(bank)):
+                self.pattern_refs[
+                    self.libseq.getPattern(bank, sequence, 0, 0)] += 1
+
+    def _get_pattern_key(self, notes, transpose, line_nr):
+        ''' identical content, transposition, length and (as it affects
+            the transposition) scale of the selected pattern '''
+        if not share_patterns:
+            return None
+        scale = (self.libseq.getScale(), self.libseq.getTonic()) \
+            if transpose else None
+        return (tuple(map(tuple, notes)), transpose, line_nr, scale)
+
+    def _assign_pattern(self, bank, sequence, current, pattern):
+        ''' replaces the pattern of a sequence, a pattern which is not
+            referenced any more is cleared '''
+        self.libseq.removePattern(bank, sequence, 0, 0)
+        self.libseq.addPattern(bank, sequence, 0, 0, pattern, True)
+        self.pattern_refs[current] = self.pattern_refs.get(current, 1) - 1
+        self.pattern_refs[pattern] = self.pattern_refs.get(pattern, 1) + 1
+        if self.pattern_refs[current] == 0:
+            self.pattern.select(current)
+            self.libseq.clear()
+        return pattern
+
+    def plan_layout(self):
+        ''' bank placement of the groups (auto transposed groups are
+            placed in the auto bank) '''
+        groups = self.tracker.get_groups()
+        auto = any(group.name.startswith('*') for group in groups)
+        return BankLayout(
+            [0 if group.name.startswith('*') else len(group.phrases)
+             for group in groups], minimum_rows, maximum_rows,
+            reserved=[auto_bank] if auto else [])
+
+    def _prepare_banks(self, layout):
+        for bank in layout.banks:
+            if self.libseq.getSequencesInBank(bank) != \
+                    layout.sequences_in_bank:
+                self.libseq.setSequencesInBank(
+                    bank, layout.sequences_in_bank)
+
+    def _get_group_conversion(self, group):
+        ''' returns the cached conversion of a group (or converts it) and
+            whether its import can be skipped entirely '''
+        cached = self.cache.get(group) if self.cache is not None else None
+        if cached is not None:
+            entry = {**cached, 'sequences': []}
+        else:
+            entry = {
+                'digest': group.digest,
+                'streams': [phrase.pattern.get_sequencer_stream()
+                            for phrase in group.phrases],
+                'sequences': []}
+        self.converted[group.name] = entry
+        skip = self.incremental and cached is not None
+        self.skipped += 1 if skip else 0
+        return entry, skip
 
     def _import_sequence(
-            self, bank, sequence, name, channel, phrase_obj, transpose):
-        self.set_sequence_name(bank, sequence, name)
-        notes = phrase_obj.pattern.get_sequencer_stream()
+            self, bank, sequence, name, channel, phrase_obj, transpose,
+            notes=None, skip=False, source=None):
+        ''' with a source pattern (holding the same notes untransposed),
+            the pattern is copied and transposed natively if possible '''
         pattern_nr = self.libseq.getPattern(bank, sequence, 0, 0)
+        if notes is None:
+            notes = phrase_obj.pattern.get_sequencer_stream()
         self.pattern.select(pattern_nr)
-        self.pattern.expand(phrase_obj.line_nr)
-        self.pattern.add_notes(notes, transpose)
+        key = self._get_pattern_key(notes, transpose, phrase_obj.line_nr)
+        if skip:
+            if key is not None:
+                self.pattern_keys.setdefault(key, pattern_nr)
+            return pattern_nr
+        self.set_sequence_name(bank, sequence, name)
+        shared = self.pattern_keys.get(key)
+        if shared is not None:
+            if shared != pattern_nr:
+                pattern_nr = self._assign_pattern(
+                    bank, sequence, pattern_nr, shared)
+            self.shared += 1
+            self.shared_events += len(notes)
+        else:
+            if self.pattern_refs.get(pattern_nr, 1) > 1:
+                # shared by a previous conversion, it needs its own now
+                created = self.libseq.createPattern()
+                self.pattern_refs[created] = 0
+                pattern_nr = self._assign_pattern(
+                    bank, sequence, pattern_nr, created)
+                self.pattern.select(pattern_nr)
+            if source is None or \
+                    not self.pattern.copy(source, notes, transpose):
+                if self.incremental:
+                    self.pattern.reset()
+                self.pattern.expand(phrase_obj.line_nr)
+                self.pattern.add_notes(notes, transpose)
+            if key is not None:
+                self.pattern_keys[key] = pattern_nr
         self.libseq.setChannel(bank, sequence, 0, channel)
         self.libseq.setGroup(bank, sequence, channel)
         if transpose:
             self.libseq.setTriggerNote(
                 bank, sequence, trigger_start_note + sequence)
+        return pattern_nr
 
-    def _import_groups(self, bank):
-        sequences = self._get_tracker_sequences()
-        sequence_nr = 0
-        sequences_in_bank = self._expand_bank(bank, sequences)
+    def _import_groups(self):
+        layout = self.plan_layout()
+        self._prepare_banks(layout)
         for group_nr, group in enumerate(self.tracker.get_groups()):
+            entry, skip = self._get_group_conversion(group)
+            streams = entry['streams']
             if group.name.startswith('*'):
                 self.libseq.setTriggerChannel(trigger_channel)
-                for phrase_nr in range(16):
+                source = None
+                for phrase_nr in range(TRANSPOSITIONS):
                     note = trigger_start_note + int(phrase_nr)
                     name = f'{group.name} {Note.get_string(note)}'
-                    self._import_sequence(
+                    pattern_nr = self._import_sequence(
                         auto_bank, phrase_nr, name, group_nr,
-                        group.phrases[0], phrase_nr)
+                        group.phrases[0], phrase_nr, streams[0], skip,
+                        source)
+                    source = pattern_nr if source is None else source
+                    entry['sequences'].append(
+                        [auto_bank, phrase_nr, pattern_nr])
+                if not skip:
+                    self.libseq.updateSequenceInfo()
             else:
+                sequences = layout.get_sequences(group_nr)
                 for phrase_nr, phrase in enumerate(group.phrases):
-                    print(sequence_nr, sequences_in_bank)
-                    if sequence_nr + 1 > sequences_in_bank:
-                        bank += 1
-                        sequences = sequences - sequence_nr + 1
-                        sequences_in_bank = self._expand_bank(
-                            bank, sequences)
-                        sequence_nr = 0
+                    bank, sequence_nr = sequences[phrase_nr]
                     name = f'{group.name} {phrase_nr}'
-                    self._import_sequence(
-                        bank, sequence_nr, name, group_nr, phrase, 0)
-                    sequence_nr += 1
+                    pattern_nr = self._import_sequence(
+                        bank, sequence_nr, name, group_nr, phrase, 0,
+                        streams[phrase_nr], skip)
+                    entry['sequences'].append(
+                        [bank, sequence_nr, pattern_nr])
 
     def get_info_all(self):
         return {
@@ -109,39 +244,40 @@ class Sequencer(zynseq, SnapshotManager):
             'pattern': self.pattern.notes
         }
 
-    def get_statistics(self):
+    def get_statistics(self, force=False):
+        ''' collects the bank and pattern usage from the RIFF data of the
+            library in one call. the result is kept until the change count
+            of the library moves on (unlike isModified() it is not reset
+            by saving), force collects it anyway '''
         ls = self.libseq
         self.bpm = ls.getTempo()
         self.bpb = ls.getBeatsPerBar()
-        self.banks = {}
-        self.patterns = {}
-        for bnum in range(1, 255):
-            seqs = ls.getSequencesInBank(bnum)
-            if seqs > 0:
-                self.banks[bnum] = False
-                for snum in range(seqs):
-                    if ls.getPattern(bnum, snum, 0, 0) >= 0:
-                        self.banks[bnum] = True
-                        for tnum in range(ls.getTracksInSequence(bnum, snum)):
-                            pids = self.get_pids_in_track(bnum, snum, tnum)
-                            for pid, isEmpty in pids.items():
-                                self.patterns[pid] = isEmpty
-
-    def get_pids_in_track(self, bnum, snum, tnum):
-        ''' iterates over the track and collects pattern indices '''
-        location = 0
+        changes = ls.getChangeCount()
+        if self.usage is None or force or changes != self.usage_changes:
+            # an export, the modified flag of the project is kept
+            riff_data = self.get_riff_data(keep_modified=True)
+            if riff_data is None:
+                return
+            self.usage = self.get_usage(ZynseqFile.parse(riff_data))
+            self.usage_changes = changes
+        self.banks, self.patterns = self.usage
+
+    @staticmethod
+    def get_usage(riff):
+        ''' banks (whether they hold patterns) and the patterns used by
+            them (whether they have events) '''
+        banks = {}
         patterns = {}
-        pattern_cnt = 0
-        total_patterns = self.libseq.getPatternsInTrack(bnum, snum, tnum)
-        while pattern_cnt != total_patterns:
-            ret = self.libseq.getPattern(bnum, snum, tnum, location)
-            if ret != '-1':
-                self.libseq.selectPattern(ret)
-                pattern_cnt += 1
-                patterns[ret] = True if self.libseq.getLastStep() > \
-                    -1 else False
-            location += 1
-        return patterns
+        for bnum, bank in riff.banks.items():
+            banks[bnum] = False
+            for sequence in bank.sequences:
+                if not sequence.tracks or not any(
+                        time == 0 for time, _ in sequence.tracks[0].patterns):
+                    continue
+                banks[bnum] = True
+                for pid in sequence.get_pattern_ids():
+                    patterns[pid] = pid in riff.patterns
+        return banks, patterns
 
     def get_value(self, expression, default):
         if hasattr(self, expression):
@@ -238,8 +374,9 @@ class Sequencer(zynseq, SnapshotManager):
 
 
 class PatternManager():
-    def __init__(self, libseq) -> None:
+    def __init__(self, libseq, zynseq=None) -> None:
         self.libseq = libseq
+        self.zynseq = zynseq
         self.id = 0
         self.tonic = 0
 
@@ -272,19 +409,35 @@ class PatternManager():
             'playhead': ls.getPatternPlayhead()
         }
 
+    def get_events(self):
+        ''' (step, note, velocity, duration, stutter count, stutter
+            duration) of the notes in the selected pattern, in one call '''
+        events = self.zynseq.get_pattern_events()
+        if events is not None:
+            return [(event.step, event.value1start, event.value2start,
+                     event.duration, event.stutterCount, event.stutterDur)
+                    for event in events if event.command == NOTE_ON]
+        # library without getPatternEvents: read the saved pattern instead
+        if self.libseq.getLastStep() < 0:
+            return []
+        data = self.zynseq.get_pattern_data(self.libseq.getPatternIndex())
+        pattern = parse_pattern_file(data) if data else None
+        if pattern is None:
+            return []
+        return [(values[0], values[4], values[5],
+                 values[1] / 100 + values[2], values[8], values[9])
+                for values in pattern.iter_events() if values[3] == NOTE_ON]
+
     @property
     def notes(self):
+        ''' [step, note, velocity, duration] per note, ordered by step and
+            note. empty steps are listed as [step] '''
+        steps = {}
+        for event in sorted(self.get_events()):
+            steps.setdefault(event[0], []).append(list(event[:4]))
         notes = []
         for step in range(self.libseq.getSteps()):
-            isStepEmpty = True
-            for note in range(0, 127):
-                vel = self.libseq.getNoteVelocity(step, note)
-                if vel:
-                    notes.append([step, note, vel, self.libseq
-                                  .getNoteDuration(step, note)])
-                    isStepEmpty = False
-            if isStepEmpty:
-                notes.append([step])
+            notes.extend(steps.get(step, [[step]]))
         return notes
 
     @notes.setter
@@ -292,14 +445,49 @@ class PatternManager():
         self.add_notes(note_list, transpose=0)
 
     def add_notes(self, note_list, transpose):
-        for index in range(len(note_list)):
-            if transpose == 0:
-                self.libseq.addNote(*note_list[index])
-            else:
-                note = note_list[index]
-                shift = self.get_shift_value(note[1], transpose, self.tonic)
-                self.libseq.addNote(
-                    note[0], note[1] + shift, note[2], note[3])
+        shifts = None
+        if transpose != 0:
+            shifts = get_offsets(
+                self.libseq.getScale(), self.libseq.getTonic(), transpose)
+        self.zynseq.add_notes(note_list, shifts)
+
+    def copy(self, source, note_list, transpose):
+        ''' fills the selected pattern with a transposed copy of the source
+            pattern. the native transposition shifts every note by the same
+            interval and refuses to push any of them out of the MIDI range,
+            so it is only used in chromatic scales when all notes fit '''
+        if not is_chromatic(self.libseq.getScale()):
+            return False
+        if note_list:
+            notes = [note for _, note, _, _ in note_list]
+            if min(notes) + transpose < 0 or max(notes) + transpose > 127:
+                return False
+        self.libseq.copyPattern(source, self.id)
+        if transpose:
+            self.libseq.transpose(transpose)
+        return True
+
+    def load(self, pattern):
+        ''' replaces the selected pattern with a decoded one (e.g. from a
+            PatternLibrary) in one call '''
+        ls = self.libseq
+        if not pattern.event_count:
+            # load_pattern skips patterns without events
+            ls.clear()
+            ls.setBeatsInPattern(pattern.beats)
+            ls.setStepsPerBeat(pattern.steps_per_beat)
+            ls.setScale(pattern.scale)
+            ls.setTonic(pattern.tonic)
+            ls.setRefNote(pattern.ref_note)
+            return True
+        return self.zynseq.set_pattern_data(self.id, pattern_to_file(
+            pattern, ls.getBeatsPerBar(), ls.getVerticalZoom(),
+            ls.getHorizontalZoom()))
+
+    def reset(self):
+        ''' clears the selected pattern and restores its default length '''
+        self.libseq.clear()
+        self.libseq.setBeatsInPattern(DEFAULT_BEATS)
 
     def expand(self, line_nr):
         if self.libseq.getSteps() < line_nr:
@@ -308,5 +496,5 @@ class PatternManager():
                 self.libseq.getBeatsInPattern() * multiplier)
 
     def get_shift_value(self, midi_note, transpose, tonic):
-        # TODO: the smart transpose functionality has yet to be implemented.
-        return transpose
+        return get_offsets(self.libseq.getScale(), tonic, transpose)[
+            midi_note]
@@ -11,7 +11,7 @@ class CLIApp(REPL):
     def __init__(self, debug=True, silent=False) -> None:
         super().__init__()
         self.debug = debug
-        self.xrns = XRNS()
+        self.xrns = XRNS(lazy=True)
         if not silent:
             print(MSG_HEADER)
             logger.info(MSG_HELP_MIN)
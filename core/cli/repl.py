@@ -1,6 +1,7 @@
 from core.io.files import get_files, get_first_file
 from core.audio.utils import is_port, format_port
 from core.audio.manipulator import Manipulator
+from core.lib.index import SnapshotIndex, get_snapshot_folders
 from core.res.cli_zynseqcmds import pcmds, lcmds
 from core.res.cli_messages import MSG_USAGE
 from .params import *
@@ -13,6 +14,7 @@ class REPL:
         self.custom_target = False
         self.events = {}
         self.last_multi = False
+        self.index = None
 
     def set_dir(self, snapshot_path, xrns_path):
         self.snapshot_path = snapshot_path
@@ -97,7 +99,8 @@ class REPL:
         success = self.xrns.load(file)
         if not success:
             return
-        self.audio.seq.import_project(file, self.xrns.project)
+        self.audio.seq.import_project(
+            file, self.xrns.project, statistics=True)
         # self.audio.seq.update_tempo()
         self.emit_event('file_loaded')
 
@@ -149,10 +152,37 @@ class REPL:
         """play midi notes to test audio channels"""
         self.audio.seq.test_midi(self.print)
 
+    def get_snapshot_folders(self):
+        ''' the snapshot folder of the shell first, then the zynthian
+            snapshot folders (if running on it) '''
+        folder = self.snapshot_path.rstrip('/')
+        return [folder] + [path for path in get_snapshot_folders()
+                           if path.rstrip('/') != folder]
+
+    def get_index(self):
+        if self.index is None:
+            self.index = SnapshotIndex()
+        self.index.update(self.get_snapshot_folders())
+        return self.index
+
+    def format_snapshot(self, row):
+        if row['error']:
+            return f"{row['name']}  ({row['error']})"
+        return f"{row['name']}  {row['bpm']} BPM, {row['banks']} banks, " \
+            f"{row['patterns']} patterns"
+
     def cmd_dir(self, par):
         """list ZSS files"""
-        self.pprint(get_files(self.snapshot_path, 'zss'))
+        index = self.get_index()
+        folders = self.get_snapshot_folders()
+        rows = index.list(folders[0])
+        self.pprint([self.format_snapshot(row) for row in rows])
         self.pprint(get_files(self.xrns_path, 'xrns'))
+        for folder in folders[1:]:
+            rows = index.list(folder)
+            if rows:
+                self.print(f'{folder}:')
+                self.pprint([self.format_snapshot(row) for row in rows])
 
     def cmd_load(self, par):
         """load ZSS file"""
@@ -178,7 +208,25 @@ class REPL:
 
     def cmd_info(self, par):
         """print statistics"""
-        self.pprint(self.audio.seq.statistics)
+        if not par:
+            self.pprint(self.audio.seq.statistics)
+            return
+        index = self.get_index()
+        row = None
+        for folder in self.get_snapshot_folders():
+            row = index.find(folder, par[0])
+            if row:
+                break
+        if not row:
+            self.print(f'No snapshot found: {par[0]}')
+            return False
+        self.pprint({
+            'file': row['name'],
+            'BPM': row['bpm'],
+            'BPB': row['bpb'],
+            'banks': row['banks'],
+            'patterns': row['patterns']
+        })
 
     def cmd_ls(self, par):
         """list properties of sequences"""
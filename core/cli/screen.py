@@ -282,9 +282,10 @@ class PatternWindow(DataWindow):
             return
         self.clear()
         if type(self.data) is list:
-            for step in self.data:
-                if len(step) > 1:
-                    repr = self.cb_line_renderer(step[1])
-                else:
-                    repr = ''
-                self.print(f'[{step[0]:02}] {repr}')
+            steps = {}
+            for note in self.data:
+                notes = steps.setdefault(note[0], [])
+                if len(note) > 1:
+                    notes.append(self.cb_line_renderer(note[1]))
+            for step, notes in steps.items():
+                self.print(f'[{step:02}] {" ".join(notes)}')
@@ -41,7 +41,7 @@ class TUIApp(REPL):
         self.debug = debug
         self.audio = AudioManager(
             init_delay=0.2, verbose=False, debug=self.debug)
-        self.xrns = XRNS()
+        self.xrns = XRNS(lazy=True)
         self.screen = Screen(stdscr)
         self.screen.init_colors()
         self.initialize_screen()
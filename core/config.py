@@ -11,13 +11,15 @@ VERSION = '0.0.1'          # version number of the performer app
 
 # Sequencer (conversion) settings
 
-create_backup = True       # whether to make a local backup of a zss
+backups = 3                # local backups kept of a zss (0: none)
+extract_xrns = False       # whether to unpack whole XRNS (incl. samples)
 vertical_zoom  = 16        # default vertical zoom for saving snapshots
 minimum_rows = 5           # minimum number of rows / columns per bank
 maximum_rows = 5           # maximum number of rows / columns per bank
 auto_bank = 10             # destination bank of auto transposed phrases
 trigger_channel = 15       # global trigger channel for sequences
 trigger_start_note = 24    # start note for auto transposed sequences  
+share_patterns = True      # identical phrases reference a single pattern
 
 # Paths
 
@@ -27,9 +29,12 @@ PATH_LIB = PATH_BASE + '/lib/zynseq/zynseq/'
 PATH_ZSS = PATH_DATA + '/zss'
 PATH_XRNS = PATH_DATA + '/xrns'
 PATH_PROJECTS = PATH_DATA + '/projects'
+PATH_CACHE = PATH_DATA + '/cache'
+PATH_INDEX = PATH_CACHE + '/snapshots.db'
 
 PATH_SAMPLES = '/zynthian/zynthian-data/soundfonts/'
 PATH_SAMPLES_MY = '/zynthian/zynthian-my-data/soundfonts/'
+PATH_ZSS_REMOTE = '/zynthian/zynthian-my-data/snapshots/'
 
 # Audio auto start configuration
 
@@ -39,6 +44,15 @@ JACK_CONFIG = '-P 70 -t 2000 -s -d alsa -d hw:0,0 ' \
 # Zynthian configuration /for bridge/
 
 SFTP_HOST = "zynthian.local"
+SFTP_PORT = 22
 SFTP_USER = "root"
 SFTP_PASSWORD = "raspberry"
 SFTP_DEFAULT_SNAPSHOT = '003'
+SFTP_KEEPALIVE = 15        # seconds between keepalive packets
+SFTP_TIMEOUT = 10          # seconds until an unresponsive server is dropped
+SFTP_BACKOFF = (1, 60)     # first and maximum delay between reconnections
+SFTP_KNOWN_HOSTS = '~/.ssh/known_hosts'
+SFTP_ACCEPT_NEW_HOST = False  # trust an unknown host once, adding its key
+WATCH_DELAY = 1.5          # quiet period before a saved project is converted
+CONVERT_WORKERS = 1        # libzynseq is process global, keep it at one
+BATCH_WORKERS = None       # processes of --batch (None: one per CPU)
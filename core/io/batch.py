@@ -0,0 +1,182 @@
+import time
+import logging
+import traceback
+from os import listdir
+from os.path import isdir, join
+from collections import Counter
+from multiprocessing import SimpleQueue
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from core.io.stdout import StdOut
+from core.lib.xrns import XRNS
+from core.lib.cache import ConversionCache
+
+logger = logging.getLogger(__name__)
+
+# the sequencer of the worker process, reused for every file it converts
+worker = None
+# files started by the workers (to tell which ones a dying worker left)
+started = None
+# conversions of a file attempted in workers which died
+ATTEMPTS = 3
+
+
+def list_projects(folder):
+    if not isdir(folder):
+        raise NotADirectoryError(folder)
+    return sorted(join(folder, file) for file in listdir(folder)
+                  if file.endswith(('.xrns', '.xrni')))
+
+
+def init_worker(queue=None):
+    ''' loads libzynseq once per worker process '''
+    global worker, started
+    started = queue
+    from core.audio.sequencer import Sequencer
+    stdout = StdOut()
+    stdout.mute()
+    try:
+        worker = Sequencer()
+        worker.initialize(scan=False)
+    finally:
+        stdout.unmute()
+
+
+def convert_file(file_path):
+    ''' converts an XRNS to a ZSS next to it. errors are reported in the
+        result instead of being raised '''
+    start = time.perf_counter()
+    if started is not None:
+        started.put(file_path)
+    result = {'file': file_path, 'output': None, 'time': 0, 'error': None}
+    stdout = StdOut()
+    stdout.mute()
+    try:
+        xrns = XRNS(lazy=True)
+        xrns.load(file_path, standard_path=False)
+        cache = ConversionCache(xrns.source.project_name)
+        worker.import_project(file_path, xrns.project, cache=cache)
+        output = xrns.get_original_path() + '.zss'
+        worker.save_file(file_path=output)
+        cache.bind(output)
+        cache.save()
+        result['output'] = output
+        result['phrases'] = xrns.project.get_total_phrases()
+    except Exception as e:
+        result['error'] = traceback.format_exception_only(e)[0].strip()
+    finally:
+        stdout.unmute()
+    result['time'] = time.perf_counter() - start
+    return result
+
+
+class BatchConverter:
+    ''' Converts a folder of XRNS files on a pool of processes, each of
+        them owning a single sequencer. '''
+
+    def __init__(self, workers=None):
+        self.workers = workers
+        self.results = []
+        self.elapsed = 0
+
+    def run(self, folder, callback=None):
+        ''' returns the results in the order of the files. when a worker
+            process dies, the files left are converted in a fresh pool
+            (of a single process, to tell which file makes it die). a file
+            running in dying workers ATTEMPTS times is reported as failed,
+            the others are converted all the same '''
+        files = list_projects(folder)
+        self.results = []
+        if not files:
+            return self.results
+        start = time.perf_counter()
+        results = {}
+        attempts = Counter()
+        workers = self.workers
+        pending = files
+        while pending:
+            running = self.convert(pending, results, workers, callback)
+            if running is None:
+                break
+            if not running:
+                # no file was started, the workers can't start
+                for file in pending:
+                    if file not in results:
+                        self.add_result(results, self.get_failure(
+                            file, 'Not converted, the worker processes '
+                            'terminated abruptly.'), callback)
+                break
+            if len(running) > 1 and workers != 1:
+                workers = 1
+            else:
+                for file in running:
+                    attempts[file] += 1
+                    if attempts[file] >= ATTEMPTS:
+                        self.add_result(results, self.get_failure(
+                            file, 'The worker process terminated abruptly '
+                            'while converting it.'), callback)
+            pending = [file for file in pending if file not in results]
+        self.results = [results[file] for file in files]
+        self.elapsed = time.perf_counter() - start
+        return self.results
+
+    def convert(self, files, results, workers=None, callback=None):
+        ''' converts the files in a pool of processes. returns None if
+            all of them are done, else the files which were running when
+            a worker died '''
+        queue = SimpleQueue()
+        futures = []
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=init_worker,
+                                 initargs=(queue,)) as pool:
+            try:
+                for file in files:
+                    futures.append(pool.submit(convert_file, file))
+            except BrokenProcessPool:
+                pass
+            broken = len(futures) < len(files)
+            for file, future in zip(files, futures):
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    broken = True
+                    continue
+                except Exception as e:
+                    result = self.get_failure(
+                        file, traceback.format_exception_only(e)[0].strip())
+                self.add_result(results, result, callback)
+        if not broken:
+            return None
+        running = set()
+        while not queue.empty():
+            running.add(queue.get())
+        return running - set(results)
+
+    @staticmethod
+    def add_result(results, result, callback=None):
+        results[result['file']] = result
+        if callback is not None:
+            callback(result)
+
+    @staticmethod
+    def get_failure(file_path, error):
+        return {'file': file_path, 'output': None, 'time': 0, 'error': error}
+
+    @property
+    def failures(self):
+        return [result for result in self.results if result['error']]
+
+    def get_report(self):
+        lines = []
+        for result in self.results:
+            name = result['file'].split('/')[-1]
+            status = f"FAILED: {result['error']}" if result['error'] \
+                else f"{result['phrases']} phrases"
+            lines.append(
+                f"{name[:40]:40} {result['time'] * 1000:8.1f} ms  {status}")
+        converted = len(self.results) - len(self.failures)
+        lines.append(f'{converted} of {len(self.results)} projects '
+                     f'converted in {self.elapsed:.2f} s, '
+                     f'{len(self.failures)} failed')
+        return lines
@@ -0,0 +1,125 @@
+import logging
+from time import monotonic
+from threading import Lock, Timer
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class EventPipeline:
+    ''' Debounces file change events per project, then runs the conversion
+        and the upload stages on separate workers.
+
+        convert(name) is called once per quiet period of a project and its
+        result is passed to upload(name, result). Events arriving while a
+        project is being converted are coalesced into a single rerun, and
+        only the latest conversion of a project waits for upload. '''
+
+    def __init__(self, convert, upload, delay=1.5, workers=1):
+        self.convert = convert
+        self.upload = upload
+        self.delay = delay
+        self.lock = Lock()
+        self.converter = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='convert')
+        self.uploader = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='upload')
+        self.timers = {}
+        self.saved = {}
+        self.converting = set()
+        self.rerun = set()
+        self.uploads = {}
+        self.coalesced = 0
+        self.processed = 0
+        self.failed = 0
+        self.latencies = []
+
+    def submit(self, name):
+        ''' registers a change of a project. never blocks the caller '''
+        with self.lock:
+            self.saved.setdefault(name, monotonic())
+            timer = self.timers.pop(name, None)
+            if timer is not None:
+                timer.cancel()
+                self.coalesced += 1
+            timer = Timer(self.delay, self._dispatch, (name,))
+            timer.daemon = True
+            self.timers[name] = timer
+            timer.start()
+
+    def _dispatch(self, name):
+        with self.lock:
+            self.timers.pop(name, None)
+            if name in self.converting:
+                self.rerun.add(name)
+                return
+            saved = self.saved.pop(name, monotonic())
+            self.converting.add(name)
+        self.converter.submit(self._convert, name, saved)
+
+    def _convert(self, name, saved):
+        result = None
+        try:
+            result = self.convert(name)
+        except (Exception, SystemExit) as e:
+            logger.error(f'Conversion of {name} failed: {e}')
+        with self.lock:
+            self.converting.discard(name)
+            if result is None:
+                self.failed += 1
+            else:
+                queued = name in self.uploads
+                self.uploads[name] = result, saved
+            rerun = name in self.rerun
+            self.rerun.discard(name)
+        if result is not None and not queued:
+            self.uploader.submit(self._upload, name)
+        if rerun:
+            self._dispatch(name)
+
+    def _upload(self, name):
+        with self.lock:
+            result, saved = self.uploads.pop(name)
+        try:
+            self.upload(name, result)
+        except (Exception, SystemExit) as e:
+            logger.error(f'Upload of {name} failed: {e}')
+            with self.lock:
+                self.failed += 1
+            return
+        latency = monotonic() - saved
+        with self.lock:
+            self.processed += 1
+            self.latencies = self.latencies[-99:] + [latency]
+        logger.info(f'{name} processed {latency:.2f}s after saving '
+                    f'(queue depth: {self.queue_depth})')
+
+    @property
+    def queue_depth(self):
+        return len(self.timers) + len(self.converting) + len(self.uploads)
+
+    @property
+    def metrics(self):
+        with self.lock:
+            latencies = self.latencies
+            return {
+                'queue_depth': self.queue_depth,
+                'debouncing': len(self.timers),
+                'converting': len(self.converting),
+                'uploading': len(self.uploads),
+                'coalesced': self.coalesced,
+                'processed': self.processed,
+                'failed': self.failed,
+                'latency_last': latencies[-1] if latencies else None,
+                'latency_avg': sum(latencies) / len(latencies)
+                if latencies else None,
+                'latency_max': max(latencies) if latencies else None
+            }
+
+    def shutdown(self):
+        with self.lock:
+            for timer in self.timers.values():
+                timer.cancel()
+            self.timers = {}
+        self.converter.shutdown(wait=True)
+        self.uploader.shutdown(wait=True)
@@ -0,0 +1,217 @@
+import stat
+import time
+import socket
+import logging
+import paramiko
+from hashlib import sha256
+from os import makedirs, stat as local_stat
+from os.path import dirname, exists, expanduser
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 32768
+
+
+def file_digest(fh):
+    digest = sha256()
+    for chunk in iter(lambda: fh.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+class UnknownHostError(paramiko.SSHException):
+    pass
+
+
+class SFTPSession:
+    ''' Persistent SFTP session with keepalives, reconnection using
+        exponential backoff and a health check. Uploads are skipped when
+        the remote file is identical, and replace the target atomically. '''
+
+    def __init__(self, host, username, password, port=22, keepalive=15,
+                 timeout=10, backoff=(1, 60),
+                 known_hosts='~/.ssh/known_hosts', accept_new_host=False):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self.backoff = backoff
+        self.known_hosts = expanduser(known_hosts)
+        self.accept_new_host = accept_new_host
+        self.transport = None
+        self.sftp = None
+
+    def open(self):
+        sock = socket.create_connection((self.host, self.port), self.timeout)
+        transport = paramiko.Transport(sock)
+        try:
+            transport.start_client(timeout=self.timeout)
+            self.verify_host_key(transport.get_remote_server_key())
+            transport.auth_password(self.username, self.password)
+            transport.set_keepalive(self.keepalive)
+            self.sftp = paramiko.SFTPClient.from_transport(transport)
+            self.sftp.get_channel().settimeout(self.timeout)
+        except BaseException:
+            transport.close()
+            raise
+        self.transport = transport
+
+    def verify_host_key(self, key):
+        ''' checks the key against known_hosts. unknown hosts are rejected
+            (like paramiko's RejectPolicy), unless new hosts are accepted:
+            their key is added to known_hosts then '''
+        host_keys = paramiko.HostKeys()
+        if exists(self.known_hosts):
+            host_keys.load(self.known_hosts)
+        host = self.host if self.port == 22 else f'[{self.host}]:{self.port}'
+        known = host_keys.lookup(host)
+        if known and key.get_name() in known:
+            if known[key.get_name()] != key:
+                raise paramiko.BadHostKeyException(
+                    host, key, known[key.get_name()])
+            return
+        if not self.accept_new_host:
+            raise UnknownHostError(
+                f'{host} is not in {self.known_hosts}. Connect once with '
+                f'ssh to add its key, or accept new hosts in the config.')
+        if dirname(self.known_hosts):
+            makedirs(dirname(self.known_hosts), exist_ok=True)
+        with open(self.known_hosts, 'a') as fh:
+            fh.write(paramiko.hostkeys.HostKeyEntry([host], key).to_line())
+        logger.warning(f'Key of {host} added to {self.known_hosts}.')
+
+    def connect(self, attempts=None):
+        ''' (re)connects, waiting exponentially longer between failures '''
+        self.close()
+        delay, attempt = self.backoff[0], 0
+        while True:
+            attempt += 1
+            try:
+                self.open()
+                return True
+            except (paramiko.AuthenticationException,
+                    paramiko.BadHostKeyException, UnknownHostError):
+                raise
+            except (OSError, EOFError, paramiko.SSHException) as e:
+                logger.error(f'{self.host} cannot be reached: {e}')
+                if attempts is not None and attempt >= attempts:
+                    raise ConnectionError(
+                        f'{self.host} cannot be reached: {e}') from e
+            logger.info(f'Reconnecting in {delay} seconds.')
+            time.sleep(delay)
+            delay = min(delay * 2, self.backoff[1])
+
+    def close(self):
+        if self.sftp is not None:
+            self.sftp.close()
+        if self.transport is not None:
+            self.transport.close()
+        self.sftp = None
+        self.transport = None
+
+    def is_alive(self):
+        ''' health check: the transport is up and the server responds '''
+        if self.transport is None or not self.transport.is_active():
+            return False
+        try:
+            self.sftp.normalize('.')
+        except (OSError, EOFError, paramiko.SSHException):
+            return False
+        return True
+
+    def ensure(self):
+        if not self.is_alive():
+            self.connect()
+
+    def call(self, method, *args):
+        ''' runs a transfer, reconnecting and retrying once on failure '''
+        self.ensure()
+        try:
+            return method(*args)
+        except (EOFError, socket.error, paramiko.SSHException) as e:
+            if self.is_alive():
+                raise
+            logger.error(f'Connection lost: {e}')
+        self.connect()
+        return method(*args)
+
+    def exists(self, path):
+        return self.call(self._stat, path) is not None
+
+    def makedirs(self, path):
+        self.call(self._makedirs, path)
+
+    def get(self, src_path, dest_path):
+        ''' downloads a file, returns False if it doesn't exist remotely '''
+        return self.call(self._get, src_path, dest_path)
+
+    def put(self, src_path, dest_path):
+        ''' uploads a file unless the remote one is identical.
+            returns whether the file was transferred '''
+        return self.call(self._put, src_path, dest_path)
+
+    def _stat(self, path):
+        try:
+            return self.sftp.stat(path)
+        except FileNotFoundError:
+            return None
+
+    def _makedirs(self, path):
+        current = ''
+        for part in path.strip('/').split('/'):
+            current += '/' + part
+            attr = self._stat(current)
+            if attr is None:
+                self.sftp.mkdir(current)
+            elif not stat.S_ISDIR(attr.st_mode):
+                raise NotADirectoryError(current)
+
+    def _get(self, src_path, dest_path):
+        if self._stat(src_path) is None:
+            return False
+        self.sftp.get(src_path, dest_path)
+        return True
+
+    def _put(self, src_path, dest_path):
+        st = local_stat(src_path)
+        if self.is_identical(src_path, st.st_size, dest_path):
+            return False
+        tmp_path = dest_path + '.tmp'
+        self.sftp.put(src_path, tmp_path, confirm=True)
+        self.sftp.utime(tmp_path, (st.st_atime, st.st_mtime))
+        try:
+            self.sftp.posix_rename(tmp_path, dest_path)
+        except OSError:
+            # no posix-rename extension, fall back to the plain rename
+            if self._stat(dest_path) is not None:
+                self.sftp.remove(dest_path)
+            self.sftp.rename(tmp_path, dest_path)
+        return True
+
+    def is_identical(self, local_path, size, remote_path):
+        attr = self._stat(remote_path)
+        if attr is None or attr.st_size != size:
+            return False
+        with open(local_path, 'rb') as fh:
+            local = file_digest(fh)
+        return self.remote_digest(remote_path) == local
+
+    def remote_digest(self, path):
+        ''' sha256 of a remote file, computed on the server if possible '''
+        try:
+            quoted = "'" + path.replace("'", "'\\''") + "'"
+            channel = self.transport.open_session(timeout=self.timeout)
+            channel.settimeout(self.timeout)
+            channel.exec_command(f'sha256sum {quoted}')
+            output = channel.makefile('rb').read().decode()
+            status = channel.recv_exit_status()
+            channel.close()
+            if status == 0 and output:
+                return output.split()[0]
+        except (paramiko.SSHException, socket.error):
+            pass
+        with self.sftp.open(path, 'rb') as fh:
+            fh.prefetch()
+            return file_digest(fh)
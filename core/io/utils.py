@@ -13,7 +13,7 @@ def is_android():
     return 'android' in sys
 
 def trim_extension(file_name):
-    for ext in ['.xrns', '.zss']:
+    for ext in ['.xrns', '.xrni', '.zss']:
         if file_name.endswith(ext):
             file_name = file_name[:0-len(ext)]
     return file_name
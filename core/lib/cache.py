@@ -0,0 +1,78 @@
+import json
+from os import makedirs, stat
+from os.path import exists
+from core.config import PATH_CACHE
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ConversionCache:
+    ''' Persistent cache of the converted groups of a project.
+        Groups are keyed by the digest of their phrase XML, so unchanged
+        instruments don't have to be converted and imported again. '''
+
+    def __init__(self, name, path=PATH_CACHE):
+        self.path = path
+        self.fpath = f'{path}/{name}.json'
+        self.layout = []
+        self.groups = {}
+        self.snapshot = None
+        self.load()
+
+    def load(self):
+        if not exists(self.fpath):
+            return False
+        try:
+            with open(self.fpath, 'r') as fh:
+                data = json.load(fh)
+            self.layout = data['layout']
+            self.groups = data['groups']
+            self.snapshot = data['snapshot']
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Can't load conversion cache '{self.fpath}': {e}")
+            self.invalidate()
+            return False
+        return True
+
+    def save(self):
+        if not exists(self.path):
+            makedirs(self.path)
+        try:
+            with open(self.fpath, 'w') as fh:
+                json.dump({
+                    'layout': self.layout,
+                    'groups': self.groups,
+                    'snapshot': self.snapshot}, fh)
+        except OSError as e:
+            logger.error(f"Can't write conversion cache '{self.fpath}': {e}")
+            return False
+        return True
+
+    def invalidate(self):
+        self.layout = []
+        self.groups = {}
+        self.snapshot = None
+
+    def get(self, group):
+        ''' returns the cached conversion of a group if its phrases
+            haven't changed since, otherwise None '''
+        entry = self.groups.get(group.name)
+        if entry and group.digest and entry['digest'] == group.digest:
+            return entry
+        return None
+
+    def update(self, layout, groups):
+        self.layout = layout
+        self.groups = groups
+
+    def bind(self, file_path):
+        ''' remembers the snapshot file which holds this conversion '''
+        st = stat(file_path)
+        self.snapshot = [st.st_size, st.st_mtime_ns]
+
+    def is_bound(self, file_path):
+        if self.snapshot is None or not exists(file_path):
+            return False
+        st = stat(file_path)
+        return self.snapshot == [st.st_size, st.st_mtime_ns]
@@ -0,0 +1,133 @@
+import sqlite3
+import logging
+from os import makedirs, scandir
+from os.path import dirname, exists, isdir
+from core.config import PATH_INDEX, PATH_ZSS, PATH_ZSS_REMOTE
+from core.lib.riff import ZynseqFile
+from core.lib.zss import read_snapshot
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS snapshots (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    version INTEGER,
+    bpm INTEGER,
+    bpb INTEGER,
+    banks INTEGER,
+    sequences INTEGER,
+    patterns INTEGER,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS snapshots_folder ON snapshots (folder, name);
+'''
+COLUMNS = ('path', 'folder', 'name', 'size', 'mtime', 'version', 'bpm',
+           'bpb', 'banks', 'sequences', 'patterns', 'error')
+
+
+def get_snapshot_folders():
+    ''' the local library and the snapshot folders of the zynthian
+        (if running on it) '''
+    folders = [PATH_ZSS]
+    if isdir(PATH_ZSS_REMOTE):
+        folders += sorted(entry.path for entry in scandir(PATH_ZSS_REMOTE)
+                          if entry.is_dir())
+    return folders
+
+
+def read_statistics(file_path):
+    ''' statistics of a snapshot derived from its RIFF data '''
+    data = read_snapshot(file_path, keys=())[1]
+    if data is None:
+        return {'error': 'no sequencer data'}
+    riff = ZynseqFile.parse(data)
+    stats = riff.get_statistics()
+    return {
+        'version': riff.version,
+        'bpm': stats['BPM'],
+        'bpb': stats['BPB'],
+        'banks': stats['banks'],
+        'sequences': stats['sequences'],
+        'patterns': stats['patterns']
+    }
+
+
+class SnapshotIndex:
+    ''' Persistent metadata index of snapshot folders (SQLite).
+        Files are only parsed again when their size or mtime changes. '''
+
+    def __init__(self, db_path=PATH_INDEX):
+        if db_path != ':memory:' and not exists(dirname(db_path)):
+            makedirs(dirname(db_path))
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def update(self, folders=None):
+        ''' brings the index of the folders up to date.
+            returns the number of (re)indexed and removed files '''
+        folders = get_snapshot_folders() if folders is None else folders
+        indexed, removed = 0, 0
+        with self.db:
+            for folder in folders:
+                changes, deleted = self._update_folder(folder)
+                indexed += changes
+                removed += deleted
+        if indexed or removed:
+            logger.debug(f'Snapshot index: {indexed} files indexed, '
+                         f'{removed} removed')
+        return indexed, removed
+
+    def _update_folder(self, folder):
+        folder = folder.rstrip('/')
+        known = {row['path']: (row['size'], row['mtime']) for row in
+                 self.db.execute('SELECT path, size, mtime FROM snapshots '
+                                 'WHERE folder = ?', (folder,))}
+        rows = []
+        entries = scandir(folder) if isdir(folder) else []
+        for entry in entries:
+            if not entry.name.endswith('.zss') or not entry.is_file():
+                continue
+            st = entry.stat()
+            if known.pop(entry.path, None) == (st.st_size, st.st_mtime_ns):
+                continue
+            row = dict.fromkeys(COLUMNS)
+            row.update(path=entry.path, folder=folder, name=entry.name,
+                       size=st.st_size, mtime=st.st_mtime_ns)
+            try:
+                row.update(read_statistics(entry.path))
+            except (OSError, ValueError, KeyError) as e:
+                row['error'] = str(e)
+            rows.append(row)
+        self.db.executemany(
+            f'INSERT OR REPLACE INTO snapshots VALUES '
+            f'({", ".join(":" + column for column in COLUMNS)})', rows)
+        self.db.executemany('DELETE FROM snapshots WHERE path = ?',
+                            [(path,) for path in known])
+        return len(rows), len(known)
+
+    def list(self, folder):
+        return [dict(row) for row in self.db.execute(
+            'SELECT * FROM snapshots WHERE folder = ? ORDER BY name',
+            (folder.rstrip('/'),))]
+
+    def get(self, file_path):
+        row = self.db.execute('SELECT * FROM snapshots WHERE path = ?',
+                              (file_path,)).fetchone()
+        return dict(row) if row else None
+
+    def find(self, folder, starts_with):
+        row = self.db.execute(
+            'SELECT * FROM snapshots WHERE folder = ? AND name >= ? '
+            'ORDER BY name LIMIT 1',
+            (folder.rstrip('/'), starts_with)).fetchone()
+        if row and row['name'].startswith(starts_with):
+            return dict(row)
+        return None
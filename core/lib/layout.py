@@ -0,0 +1,82 @@
+MAX_BANKS = 64
+
+
+class BankLayout:
+    ''' Placement of the phrases of tracker groups in the square grids of
+        zynseq banks (sequences are numbered column by column).
+
+        Every group starts at the top of a column and fills whole columns.
+        Groups fitting in a bank are never split, they are put in the first
+        bank with enough free columns (keeping the order of the project as
+        far as possible). Larger groups start a new bank and continue in
+        the following ones. The grid size giving the fewest banks is used. '''
+
+    def __init__(self, groups, minimum_rows=5, maximum_rows=5, first_bank=1,
+                 reserved=(), max_banks=MAX_BANKS):
+        self.groups = list(groups)
+        self.first_bank = first_bank
+        self.reserved = set(reserved)
+        self.max_banks = max_banks
+        self.rows = minimum_rows
+        self.columns = []
+        self.placements = []
+        for rows in range(minimum_rows, maximum_rows + 1):
+            columns, placements = self.plan(rows)
+            if rows == minimum_rows or len(columns) < len(self.columns):
+                self.rows = rows
+                self.columns = columns
+                self.placements = placements
+        self.banks = self.get_bank_numbers(len(self.columns))
+
+    def plan(self, rows):
+        ''' columns used per bank and the (bank, column) where each group
+            starts, banks counted from 0 '''
+        columns = []
+        placements = []
+        for phrases in self.groups:
+            needed = -(-phrases // rows)
+            if needed == 0:
+                placements.append(None)
+                continue
+            if needed <= rows:
+                bank = next((bank for bank, used in enumerate(columns)
+                             if rows - used >= needed), len(columns))
+            else:
+                bank = len(columns)
+            if bank == len(columns):
+                columns.append(0)
+            placements.append((bank, columns[bank]))
+            while needed:
+                filled = min(needed, rows - columns[bank])
+                columns[bank] += filled
+                needed -= filled
+                if needed:
+                    bank += 1
+                    columns.append(0)
+        return columns, placements
+
+    def get_bank_numbers(self, count):
+        banks = [bank for bank in range(self.first_bank, self.max_banks + 1)
+                 if bank not in self.reserved][:count]
+        if len(banks) < count:
+            raise ValueError(f'The project needs {count} banks, '
+                             f'only {len(banks)} are available.')
+        return banks
+
+    @property
+    def sequences_in_bank(self):
+        return self.rows * self.rows
+
+    def get_sequences(self, group):
+        ''' (bank number, sequence) of each phrase of a group '''
+        placement = self.placements[group]
+        if placement is None:
+            return []
+        bank, column = placement
+        size = self.sequences_in_bank
+        result = []
+        for phrase in range(self.groups[group]):
+            position = column * self.rows + phrase
+            result.append((self.banks[bank + position // size],
+                           position % size))
+        return result
@@ -0,0 +1,147 @@
+import mmap
+from struct import Struct
+from core.lib.riff import EVENT, NOTE_ON, Pattern
+
+# Pattern library: many patterns in one file, read through mmap.
+#
+# Header:
+#     Magic "zpat" [4]
+#     Format version [4]
+#     Quantity of patterns [4]
+#     Offset of the first event record [4]
+# Index (one entry per pattern):
+#     First event record [4]
+#     Quantity of event records [4]
+#     Quantity of beats [4]
+#     Steps per beat [2]
+#     Map / scale [1]
+#     Scale tonic [1]
+#     Reference note [1]
+#     Lowest note [1] (255 if there are no notes)
+#     Highest note [1]
+#     Padding [1]
+#     Name [16]
+# Event records: events of the patn block of the zynseq RIFF format
+# (version 8), 16 bytes each.
+
+MAGIC = b'zpat'
+LIBRARY_VERSION = 1
+HEADER = Struct('>4sIII')
+ENTRY = Struct('>IIIHBBBBBx16s')
+NO_NOTES = 0xff
+
+
+def get_note_range(pattern):
+    notes = [values[4] for values in pattern.iter_events()
+             if values[3] == NOTE_ON]
+    return (min(notes), max(notes)) if notes else (NO_NOTES, 0)
+
+
+def write_library(file_path, patterns):
+    ''' writes (name, pattern) pairs to a pattern library file.
+        names are truncated to 16 bytes like sequence names '''
+    patterns = list(patterns)
+    records = HEADER.size + ENTRY.size * len(patterns)
+    with open(file_path, 'wb') as fh:
+        fh.write(HEADER.pack(MAGIC, LIBRARY_VERSION, len(patterns), records))
+        first = 0
+        for name, pattern in patterns:
+            count = pattern.event_count
+            fh.write(ENTRY.pack(
+                first, count, pattern.beats, pattern.steps_per_beat,
+                pattern.scale, pattern.tonic, pattern.ref_note,
+                *get_note_range(pattern), name.encode('utf-8')[:16]))
+            first += count
+        for name, pattern in patterns:
+            fh.write(pattern.events_to_bytes())
+
+
+def get_named_patterns(riff):
+    ''' (name, pattern) of the patterns used by the sequences of a RIFF
+        file, named after the first sequence using them '''
+    names = {}
+    for bank_id, index, sequence in riff.get_sequences():
+        for pattern_id in sequence.get_pattern_ids():
+            names.setdefault(pattern_id, sequence.name or f'{bank_id}/{index}')
+    return [(name, riff.patterns[pattern_id])
+            for pattern_id, name in names.items()
+            if pattern_id in riff.patterns and
+            riff.patterns[pattern_id].event_count]
+
+
+class PatternLibrary:
+    ''' Read only access to a pattern library file. The file is mapped
+        into memory, only the index entries and the events of the patterns
+        accessed are read. '''
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        with open(file_path, 'rb') as fh:
+            self.mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mm) < HEADER.size:
+            self.close()
+            raise ValueError(f'Invalid pattern library {file_path}')
+        magic, version, self.count, self.records = \
+            HEADER.unpack_from(self.mm)
+        if magic != MAGIC or version != LIBRARY_VERSION or \
+                self.records != HEADER.size + ENTRY.size * self.count:
+            self.close()
+            raise ValueError(f'Invalid pattern library {file_path}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self.mm.close()
+
+    def get_entry(self, index):
+        ''' (first record, records, beats, steps per beat, scale, tonic,
+            reference note, lowest note, highest note, name) '''
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return ENTRY.unpack_from(self.mm, HEADER.size + ENTRY.size * index)
+
+    def get_name(self, index):
+        name = self.get_entry(index)[9]
+        return name.split(b'\0', 1)[0].decode('utf-8', 'replace')
+
+    def get_names(self):
+        return [self.get_name(index) for index in range(self.count)]
+
+    def get_pattern(self, index, pattern_id=0):
+        ''' the pattern (its events are decoded on first access) '''
+        first, records, beats, spb, scale, tonic, ref_note = \
+            self.get_entry(index)[:7]
+        pattern = Pattern(pattern_id, beats, spb, scale, tonic, ref_note)
+        start = self.records + first * EVENT.size
+        pattern._raw = self.mm[start:start + records * EVENT.size]
+        return pattern
+
+    def find(self, name):
+        ''' index of the first pattern called name, None if missing '''
+        for index in range(self.count):
+            if self.get_name(index) == name:
+                return index
+        return None
+
+    def search(self, text='', note=None, beats=None):
+        ''' indexes of the patterns with text in their names (ignoring
+            case), playing a note in their range and of a length '''
+        text = text.lower()
+        result = []
+        for index in range(self.count):
+            entry = self.get_entry(index)
+            if beats is not None and entry[2] != beats:
+                continue
+            if note is not None and not entry[7] <= note <= entry[8]:
+                continue
+            if text and text not in self.get_name(index).lower():
+                continue
+            result.append(index)
+        return result
@@ -0,0 +1,403 @@
+import base64
+from struct import Struct, iter_unpack, pack, pack_into
+
+# Pure Python reader / writer of the zynseq RIFF format
+# (see core/lib/zynseq/zynseq/file_format.txt)
+
+VERSION = 8
+TICKS_PER_BEAT = 24
+
+BLOCK = Struct('>4sI')
+VERS = Struct('>IHHBBxxHH')
+VERS_PATTERN = Struct('>IHHH')
+PATN = Struct('>IIHBBBx')
+PATN_V4 = Struct('>IIHBB')
+PATN_PATTERN = Struct('>IHBBBx')
+BANK = Struct('>BxI')
+SEQUENCE = Struct('>BBBx16sI')
+SEQUENCE_V5 = Struct('>BBBxI')
+TRACK = Struct('>BBBxH')
+COUNT = Struct('>I')
+EVENT_FORMAT = '>IHHBBBBBBBx'
+EVENT_FORMAT_V7 = '>IHHBBBBBx'
+EVENT = Struct(EVENT_FORMAT)
+EVENT_V7 = Struct(EVENT_FORMAT_V7)
+PATTERN_REF = '>II'
+TIMEBASE_EVENT = '>HHHH'
+
+NOTE_ON = 0x90
+
+
+class Event:
+    ''' step event of a pattern. duration is stored as in the file
+        (units and hundredths) to be written back unchanged '''
+    __slots__ = ('step', 'decimal', 'units', 'command', 'value1_start',
+                 'value2_start', 'value1_end', 'value2_end',
+                 'stutter_count', 'stutter_dur')
+
+    def __init__(self, step, decimal, units, command, value1_start,
+                 value2_start, value1_end, value2_end, stutter_count=0,
+                 stutter_dur=0):
+        self.step = step
+        self.decimal = decimal
+        self.units = units
+        self.command = command
+        self.value1_start = value1_start
+        self.value2_start = value2_start
+        self.value1_end = value1_end
+        self.value2_end = value2_end
+        self.stutter_count = stutter_count
+        self.stutter_dur = stutter_dur
+
+    def __repr__(self) -> str:
+        return f'[{self.step}, {self.value1_start}, ' \
+            f'{self.value2_start}, {self.duration}]'
+
+    @classmethod
+    def note(cls, step, note, velocity, duration):
+        units = int(duration)
+        return cls(step, int((duration - units) * 100), units, NOTE_ON,
+                   note, velocity, note, 0)
+
+    @property
+    def duration(self):
+        return self.decimal / 100 + self.units
+
+    @property
+    def values(self):
+        return (self.step, self.decimal, self.units, self.command,
+                self.value1_start, self.value2_start, self.value1_end,
+                self.value2_end, self.stutter_count, self.stutter_dur)
+
+
+class Pattern:
+    ''' pattern block. events are decoded on first access only,
+        untouched patterns are written back from the original buffer '''
+
+    def __init__(self, id=0, beats=4, steps_per_beat=4, scale=0, tonic=0,
+                 ref_note=60, events=None):
+        self.id = id
+        self.beats = beats
+        self.steps_per_beat = steps_per_beat
+        self.scale = scale
+        self.tonic = tonic
+        self.ref_note = ref_note
+        self._events = [] if events is None else events
+        self._raw = None
+        self._version = VERSION
+
+    def __repr__(self) -> str:
+        return f'Pattern({self.id}, {self.beats}x{self.steps_per_beat}, ' \
+            f'{self.event_count} events)'
+
+    @property
+    def steps(self):
+        return self.beats * self.steps_per_beat
+
+    @property
+    def length(self):
+        ''' length in clock cycles '''
+        return self.beats * TICKS_PER_BEAT
+
+    @property
+    def event_count(self):
+        if self._raw is not None:
+            return len(self._raw) // self._event_size()
+        return len(self._events)
+
+    @property
+    def events(self):
+        if self._raw is not None:
+            fmt = EVENT_FORMAT if self._version > 7 else EVENT_FORMAT_V7
+            self._events = [Event(*values)
+                            for values in iter_unpack(fmt, self._raw)]
+            self._raw = None
+        return self._events
+
+    @events.setter
+    def events(self, events):
+        self._events = events
+        self._raw = None
+
+    def _event_size(self):
+        return EVENT.size if self._version > 7 else EVENT_V7.size
+
+    def iter_events(self):
+        ''' raw event tuples without creating Event objects '''
+        if self._raw is not None:
+            fmt = EVENT_FORMAT if self._version > 7 else EVENT_FORMAT_V7
+            for values in iter_unpack(fmt, self._raw):
+                yield values if self._version > 7 else values + (0, 0)
+        else:
+            for event in self._events:
+                yield event.values
+
+    def get_notes(self):
+        ''' [step, note, velocity, duration] of the note events '''
+        return [[values[0], values[4], values[5],
+                 values[1] / 100 + values[2]]
+                for values in self.iter_events() if values[3] == NOTE_ON]
+
+    def events_to_bytes(self):
+        if self._raw is not None and self._version > 7:
+            return bytes(self._raw)
+        buffer = bytearray(EVENT.size * self.event_count)
+        for index, values in enumerate(self.iter_events()):
+            pack_into(EVENT_FORMAT, buffer, index * EVENT.size, *values)
+        return bytes(buffer)
+
+
+class Track:
+    def __init__(self, channel=0, output=0, map=0, patterns=None):
+        self.channel = channel
+        self.output = output
+        self.map = map
+        self.patterns = [] if patterns is None else patterns
+
+    def __repr__(self) -> str:
+        return f'Track(ch {self.channel}, {self.patterns})'
+
+
+class Sequence:
+    def __init__(self, play_mode=0, group=0, trigger=0xff, name='',
+                 tracks=None, timebase=None):
+        self.play_mode = play_mode
+        self.group = group
+        self.trigger = trigger
+        self.name = name
+        self.tracks = [] if tracks is None else tracks
+        self.timebase = [] if timebase is None else timebase
+
+    def __repr__(self) -> str:
+        return f'Sequence({self.name!r}, {len(self.tracks)} tracks)'
+
+    def get_pattern_ids(self):
+        return [pattern_id for track in self.tracks
+                for _, pattern_id in track.patterns]
+
+
+class Bank:
+    def __init__(self, id=1, sequences=None):
+        self.id = id
+        self.sequences = [] if sequences is None else sequences
+
+    def __repr__(self) -> str:
+        return f'Bank({self.id}, {len(self.sequences)} sequences)'
+
+
+class ZynseqFile:
+    ''' content of a zynseq RIFF file (or snapshot payload) '''
+
+    def __init__(self):
+        self.version = VERSION
+        self.tempo = 120
+        self.beats_per_bar = 4
+        self.trigger_channel = 0xff
+        self.trigger_device = 0xff
+        self.vertical_zoom = 16
+        self.horizontal_zoom = 16
+        self.patterns = {}
+        self.banks = {}
+        self.unknown = []
+
+    def __repr__(self) -> str:
+        return f'ZynseqFile(v{self.version}, {len(self.patterns)} patterns,' \
+            f' {len(self.banks)} banks)'
+
+    @classmethod
+    def from_b64(cls, b64_data):
+        return cls.parse(base64.b64decode(b64_data))
+
+    @classmethod
+    def from_file(cls, file_path):
+        with open(file_path, 'rb') as fh:
+            return cls.parse(fh.read())
+
+    @classmethod
+    def parse(cls, data):
+        riff = cls()
+        view = memoryview(data)
+        for block_id, block in iter_blocks(view):
+            if block_id == b'vers':
+                riff._parse_version(block)
+            elif block_id == b'patn':
+                pattern = parse_pattern(block, riff.version)
+                riff.patterns[pattern.id] = pattern
+            elif block_id == b'bank':
+                bank = parse_bank(block, riff.version)
+                riff.banks[bank.id] = bank
+            else:
+                riff.unknown.append((block_id, bytes(block)))
+        return riff
+
+    def _parse_version(self, block):
+        if len(block) != VERS.size:
+            raise ValueError('Invalid vers block')
+        (self.version, self.tempo, self.beats_per_bar, self.trigger_channel,
+         self.trigger_device, self.vertical_zoom,
+         self.horizontal_zoom) = VERS.unpack(block)
+        if not 4 <= self.version <= VERSION:
+            raise ValueError(f'Unsupported file version {self.version}')
+
+    def get_statistics(self):
+        ''' same figures as Sequencer.statistics: banks holding sequences
+            and the non-empty patterns referenced by them '''
+        sequences = self.get_sequences()
+        used = {pattern_id for _, _, sequence in sequences
+                for pattern_id in sequence.get_pattern_ids()}
+        return {
+            'BPM': self.tempo,
+            'BPB': self.beats_per_bar,
+            'banks': len(self.banks),
+            'sequences': len(sequences),
+            'patterns': len([pattern_id for pattern_id in used
+                             if pattern_id in self.patterns and
+                             self.patterns[pattern_id].event_count])
+        }
+
+    def get_sequences(self):
+        ''' (bank id, index, sequence) of all sequences '''
+        return [(bank.id, index, sequence)
+                for bank in self.banks.values()
+                for index, sequence in enumerate(bank.sequences)]
+
+    def to_bytes(self):
+        ''' encodes the content in the current (version 8) format '''
+        chunks = [BLOCK.pack(b'vers', VERS.size), VERS.pack(
+            VERSION, self.tempo, self.beats_per_bar, self.trigger_channel,
+            self.trigger_device, self.vertical_zoom, self.horizontal_zoom)]
+        for pattern in self.patterns.values():
+            if not pattern.event_count:
+                continue
+            events = pattern.events_to_bytes()
+            chunks.append(BLOCK.pack(b'patn', PATN.size + len(events)))
+            chunks.append(PATN.pack(
+                pattern.id, pattern.beats, pattern.steps_per_beat,
+                pattern.scale, pattern.tonic, pattern.ref_note))
+            chunks.append(events)
+        for bank in self.banks.values():
+            if not bank.sequences:
+                continue
+            content = bank_to_bytes(bank)
+            chunks.append(BLOCK.pack(b'bank', len(content)))
+            chunks.append(content)
+        for block_id, content in self.unknown:
+            chunks.append(BLOCK.pack(block_id, len(content)))
+            chunks.append(content)
+        return b''.join(chunks)
+
+    def to_b64(self):
+        return base64.b64encode(self.to_bytes()).decode('utf-8')
+
+
+def iter_blocks(view):
+    ''' yields (id, content) of the RIFF blocks as memoryview slices '''
+    offset = 0
+    while offset + BLOCK.size <= len(view):
+        block_id, size = BLOCK.unpack_from(view, offset)
+        offset += BLOCK.size
+        if offset + size > len(view):
+            raise ValueError(f'Truncated {block_id!r} block')
+        yield block_id, view[offset:offset + size]
+        offset += size
+
+
+def parse_pattern(block, version=VERSION, pattern_id=None):
+    ''' parses a patn block. pattern files (saved by save_pattern)
+        have no pattern id, it has to be specified instead '''
+    if pattern_id is not None:
+        header = PATN_PATTERN
+        beats, spb, scale, tonic, ref_note = header.unpack_from(block)
+    elif version == 4:
+        header = PATN_V4
+        pattern_id, beats, spb, scale, tonic = header.unpack_from(block)
+        ref_note = 60
+    else:
+        header = PATN
+        pattern_id, beats, spb, scale, tonic, ref_note = \
+            header.unpack_from(block)
+    pattern = Pattern(pattern_id, beats, spb, scale, tonic, ref_note)
+    pattern._version = version
+    events = block[header.size:]
+    if len(events) % pattern._event_size():
+        raise ValueError(f'Invalid events in pattern {pattern_id}')
+    pattern._raw = events
+    return pattern
+
+
+def parse_pattern_file(data, pattern_id=0):
+    ''' parses a file written by save_pattern '''
+    view = memoryview(data)
+    version = VERSION
+    for block_id, block in iter_blocks(view):
+        if block_id == b'vers':
+            if len(block) != VERS_PATTERN.size:
+                raise ValueError('Invalid vers block')
+            version = VERS_PATTERN.unpack(block)[0]
+        elif block_id == b'patn':
+            return parse_pattern(block, version, pattern_id)
+    return None
+
+
+def pattern_to_file(pattern, beats_per_bar=4, vertical_zoom=16,
+                    horizontal_zoom=16):
+    ''' encodes a pattern as a file read by load_pattern (which takes the
+        beats per bar and zoom of the file as well) '''
+    events = pattern.events_to_bytes()
+    return b''.join((
+        BLOCK.pack(b'vers', VERS_PATTERN.size),
+        VERS_PATTERN.pack(VERSION, beats_per_bar, vertical_zoom,
+                          horizontal_zoom),
+        BLOCK.pack(b'patn', PATN_PATTERN.size + len(events)),
+        PATN_PATTERN.pack(pattern.beats, pattern.steps_per_beat,
+                          pattern.scale, pattern.tonic, pattern.ref_note),
+        events))
+
+
+def parse_bank(block, version=VERSION):
+    bank_id, count = BANK.unpack_from(block)
+    offset = BANK.size
+    bank = Bank(bank_id)
+    for index in range(count):
+        if version >= 6:
+            mode, group, trigger, name, tracks = \
+                SEQUENCE.unpack_from(block, offset)
+            name = bytes(name).split(b'\0', 1)[0].decode('utf-8', 'replace')
+            offset += SEQUENCE.size
+        else:
+            mode, group, trigger, tracks = \
+                SEQUENCE_V5.unpack_from(block, offset)
+            name = str(index + 1)
+            offset += SEQUENCE_V5.size
+        sequence = Sequence(mode, group, trigger, name)
+        for _ in range(tracks):
+            channel, output, map, patterns = TRACK.unpack_from(block, offset)
+            offset += TRACK.size
+            end = offset + patterns * 8
+            sequence.tracks.append(Track(channel, output, map, list(
+                iter_unpack(PATTERN_REF, block[offset:end]))))
+            offset = end
+        events = COUNT.unpack_from(block, offset)[0]
+        offset += COUNT.size
+        end = offset + events * 8
+        sequence.timebase = list(
+            iter_unpack(TIMEBASE_EVENT, block[offset:end]))
+        offset = end
+        bank.sequences.append(sequence)
+    return bank
+
+
+def bank_to_bytes(bank):
+    chunks = [BANK.pack(bank.id, len(bank.sequences))]
+    for sequence in bank.sequences:
+        chunks.append(SEQUENCE.pack(
+            sequence.play_mode, sequence.group, sequence.trigger,
+            sequence.name.encode('utf-8')[:16], len(sequence.tracks)))
+        for track in sequence.tracks:
+            chunks.append(TRACK.pack(track.channel, track.output, track.map,
+                                     len(track.patterns)))
+            chunks.extend(pack(PATTERN_REF, *ref) for ref in track.patterns)
+        chunks.append(COUNT.pack(len(sequence.timebase)))
+        chunks.extend(pack(TIMEBASE_EVENT, *event)
+                      for event in sequence.timebase)
+    return b''.join(chunks)
@@ -0,0 +1,59 @@
+import json
+import logging
+from functools import lru_cache
+from core.config import PATH_BASE
+
+logger = logging.getLogger(__name__)
+
+PATH_SCALES = PATH_BASE + '/lib/zynseq/scales.json'
+TRANSPOSITIONS = 16
+
+
+@lru_cache(maxsize=None)
+def get_scales():
+    ''' scale degrees in the order of the scale indexes of zynseq '''
+    try:
+        with open(PATH_SCALES, 'r') as fh:
+            return tuple(tuple(scale['scale']) for scale in json.load(fh))
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Can't load scales '{PATH_SCALES}': {e}")
+        return ((0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11),)
+
+
+def get_degrees(scale):
+    scales = get_scales()
+    return scales[scale] if 0 <= scale < len(scales) else scales[0]
+
+
+def is_chromatic(scale):
+    return len(get_degrees(scale)) == 12
+
+
+@lru_cache(maxsize=None)
+def get_table(scale, tonic):
+    ''' offsets by transposition and pitch class. a transposition moves
+        notes by scale degrees, notes outside of the scale keep their
+        distance from the degree below them. in the chromatic scale
+        transposing by n degrees is the same as by n semitones '''
+    degrees = get_degrees(scale)
+    length = len(degrees)
+    table = []
+    for transpose in range(TRANSPOSITIONS):
+        offsets = []
+        for pitch in range(12):
+            relative = (pitch - tonic) % 12
+            degree = max(index for index, value in enumerate(degrees)
+                         if value <= relative)
+            octave, target = divmod(degree + transpose, length)
+            offsets.append(degrees[target] + octave * 12 - degrees[degree])
+        table.append(tuple(offsets))
+    return tuple(table)
+
+
+@lru_cache(maxsize=None)
+def get_offsets(scale, tonic, transpose):
+    ''' offsets of the 128 MIDI notes, as taken by zynseq.add_notes '''
+    if not 0 <= transpose < TRANSPOSITIONS:
+        return (transpose,) * 128
+    offsets = get_table(scale, tonic)[transpose]
+    return tuple(offsets[note % 12] for note in range(128))
@@ -1,9 +1,13 @@
+from array import array
+from bisect import bisect_left, bisect_right
+
 
 class Note:
     NOTES = ["C", "C#", "D", "D#", "E",
              "F", "F#", "G", "G#", "A", "A#", "B"]
     OFFNOTE = 'OFF'
     EMPTY = '---'
+    __slots__ = ('midi', 'velocity', 'duration')
 
     def __init__(self, midi_note=0, velocity=0, duration=0) -> None:
         self.midi = midi_note
@@ -41,100 +45,219 @@ class Note:
         return code
 
 
+def get_durations(steps, columns, line_number, polyphony):
+    ''' durations of the cells of a phrase given in step order.
+        a note lasts until the next cell (note or note-off) of its
+        column, the last cell of a column until the end of the phrase.
+        computed in one backward pass over all columns '''
+    following = [line_number] * polyphony
+    durations = []
+    for step, column in zip(reversed(steps), reversed(columns)):
+        durations.append(following[column] - step)
+        following[column] = step
+    durations.reverse()
+    return array('H', durations)
+
+
+class NoteView(Note):
+    ''' a note of a TrackerPattern, reads and writes its columns '''
+    __slots__ = ('_pattern', '_index')
+
+    def __init__(self, pattern, index) -> None:
+        self._pattern = pattern
+        self._index = index
+
+    def _column(name):
+        return property(
+            lambda self: getattr(self._pattern, name)[self._index],
+            lambda self, value: getattr(self._pattern, name).__setitem__(
+                self._index, value))
+
+    midi = _column('midis')
+    velocity = _column('velocities')
+    duration = _column('durations')
+    del _column
+
+
 class TrackerPattern:
-    def __init__(self, line_number=0, notes=[]) -> None:
-        self._notes = {}
+    ''' notes of a phrase in parallel columns (step, note column, midi,
+        velocity, duration) ordered by step and note column.
+        Note objects are only created as views when asked for '''
+
+    def __init__(self, line_number=0, notes=[], duration_measure=1) -> None:
         self.line_number = line_number
-        self.duration_measure = 1
+        # lines per sequencer step, durations are divided by it
+        self.duration_measure = duration_measure
+        self.clear()
         if line_number > 0 and notes:
             self.add_notes(notes)
             self.calculate_durations()
 
     def __repr__(self) -> str:
-        return []
+        return f'<TrackerPattern {self.line_number} lines, ' \
+            f'{len(self.steps)} notes>'
+
+    def __len__(self):
+        return len(self.steps)
+
+    def clear(self):
+        self.polyphony = 0
+        self.steps = array('H')
+        self.columns = array('B')
+        self.midis = array('h')
+        self.velocities = array('H')
+        self.durations = array('H')
+        self._view = None
+
+    def append(self, step, column, midi, velocity, duration=0):
+        self.steps.append(step)
+        self.columns.append(column)
+        self.midis.append(midi)
+        self.velocities.append(velocity)
+        self.durations.append(duration)
 
     def add_notes(self, notes):
-        self._notes = {}
-        polyphony = self.get_polyphony_level(notes)
-        for step in range(self.line_number):
-            self._notes[step] = [None] * polyphony
-            if step in notes:
-                for num, note in enumerate(notes[step]):
-                    self._notes[step][num] = note
+        self.clear()
+        self.polyphony = self.get_polyphony_level(notes)
+        cells = [(step, column, note) for step in sorted(notes)
+                 if 0 <= step < self.line_number
+                 for column, note in enumerate(notes[step])
+                 if note is not None]
+        self.steps = array('H', [step for step, _, _ in cells])
+        self.columns = array('B', [column for _, column, _ in cells])
+        self.midis = array('h', [note.midi for _, _, note in cells])
+        self.velocities = array('H', [note.velocity for _, _, note in cells])
+        self.durations = array('H', [note.duration for _, _, note in cells])
 
     @property
     def notes(self):
-        return self._notes
+        ''' step -> notes of the step padded with None to the polyphony '''
+        if self._view is None:
+            self._view = {step: [None] * self.polyphony
+                          for step in range(self.line_number)}
+            for index, (step, column) in enumerate(
+                    zip(self.steps, self.columns)):
+                self._view[step][column] = NoteView(self, index)
+        return self._view
 
     def get_polyphony_level(self, notes):
         return max([len(notes) for step, notes in notes.items()])
 
+    def find(self, line, col):
+        ''' position of the cell in the columns, or where it belongs.
+            the cells of a step are ordered by note column '''
+        start = bisect_left(self.steps, line)
+        end = bisect_right(self.steps, line, start)
+        return bisect_left(self.columns, col, start, end)
+
     def get_note(self, line, col):
-        return self._notes[line, col]
+        index = self.find(line, col)
+        if index < len(self.steps) and self.steps[index] == line \
+                and self.columns[index] == col:
+            return NoteView(self, index)
+        return None
 
     def set_note(self, line, col, note):
-        self._notes[line, col] = note
+        index = self.find(line, col)
+        exists = index < len(self.steps) and self.steps[index] == line \
+            and self.columns[index] == col
+        if exists:
+            for column in (self.steps, self.columns, self.midis,
+                           self.velocities, self.durations):
+                del column[index]
+        if note is not None:
+            self.steps.insert(index, line)
+            self.columns.insert(index, col)
+            self.midis.insert(index, note.midi)
+            self.velocities.insert(index, note.velocity)
+            self.durations.insert(index, note.duration)
+            self.polyphony = max(self.polyphony, col + 1)
+        self._view = None
 
     def calculate_durations(self):
-        polyphony = len(self._notes[0])
-        for column in range(polyphony):
-            last_step = 0
-            last_note = Note()
-            for step in range(self.line_number):
-                cell = self._notes[step][column]
-                if cell:
-                    last_note.duration = step - last_step
-                    last_note = cell
-                    last_step = step
-            last_note.duration = step - last_step + 1
+        self.durations = get_durations(
+            self.steps, self.columns, self.line_number, self.polyphony)
 
     def calculate_duration_for(self, line, col):
+        ''' updates the duration of a single note '''
+        index = self.find(line, col)
         note = self.get_note(line, col)
-        for step in range(line + 1, self.line_number):
-            cell = self._notes[step][col]
-            if cell:
-                note.duration = step - line
+        if note is None:
+            return
+        next_step = self.line_number
+        for following in range(index + 1, len(self.steps)):
+            if self.columns[following] == col:
+                next_step = self.steps[following]
+                break
+        note.duration = next_step - line
 
     def get_sequencer_stream(self):
-        lines = []
-        for step in range(self.line_number):
-            if any(self._notes[step]):
-                for note in self._notes[step]:
-                    if note is not None and note.midi != -1:
-                        l = [step, note.midi,
-                             note.velocity,
-                             note.duration / self.duration_measure]
-                        lines.append(l)
-        return lines
+        measure = self.duration_measure
+        return [[step, midi, velocity, duration / measure]
+                for step, midi, velocity, duration in zip(
+                    self.steps, self.midis, self.velocities, self.durations)
+                if midi != -1]
 
 
 class TrackerPhrase:
+    ''' notes may be given as a callable returning them, in that case
+        they are decoded on the first access of the pattern '''
+
     def __init__(self, **kwargs) -> None:
         self.name = kwargs['name']
         self.preset = kwargs['preset']
         self.lpb = kwargs['lpb']
         self.line_nr = int(kwargs['#lines'])
-        self._notes = []
-        self.add_notes(kwargs['notes'])
+        # phrases are imported one line per step (whatever their lpb),
+        # so note durations stay in lines to match the note spacing
+        self.duration_measure = 1
+        self._notes = None
+        self._source = None
+        if callable(kwargs['notes']):
+            self._source = kwargs['notes']
+        else:
+            self.add_notes(kwargs['notes'])
 
     def add_notes(self, notes):
-        self._notes = TrackerPattern(self.line_nr, notes)
+        self._notes = TrackerPattern(
+            self.line_nr, notes, self.duration_measure)
+        self._source = None
+
+    @property
+    def decoded(self):
+        return self._notes is not None
 
     @property
     def pattern(self):
+        if self._notes is None:
+            self.add_notes(self._source())
         return self._notes
 
     @property
     def notes(self):
-        return self._notes.notes
+        return self.pattern.notes
 
 
 class TrackerGroup:
-    def __init__(self, name, phrases) -> None:
+    ''' the digest may be given as a callable returning it, in that case
+        it is computed on its first access '''
+
+    def __init__(self, name, phrases, digest=None) -> None:
         self.name = name
+        self._digest = digest
         self.phrases = []
         self.add_phrases(phrases)
 
+    @property
+    def digest(self):
+        if callable(self._digest):
+            self._digest = self._digest()
+        return self._digest
+
+    @digest.setter
+    def digest(self, digest):
+        self._digest = digest
+
     def add_phrases(self, phrases):
         for phrase in phrases:
             self.phrases.append(TrackerPhrase(**phrase))
@@ -156,12 +279,20 @@ class TrackerProject:
         for group in groups:
             self._groups.append(TrackerGroup(**group))
 
+    def add_group(self, group):
+        if not isinstance(group, TrackerGroup):
+            raise TypeError
+        self._groups.append(group)
+
     def get_groups(self):
         return self._groups
 
     def get_group(self, number):
         return self._groups[number]
 
+    def get_layout(self):
+        return [[group.name, len(group.phrases)] for group in self._groups]
+
     def get_total_phrases(self):
         return len([phrase for group in self._groups
                     for phrase in group.phrases])
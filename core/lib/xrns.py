@@ -1,20 +1,32 @@
-from os.path import isfile, isdir, exists, abspath, relpath, join, splitext
-from os import walk, mkdir
+from os.path import isfile, exists, abspath, relpath, join, splitext
+from os import walk, mkdir, listdir
 import zipfile
+import logging
+from contextlib import contextmanager
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha1
 import xml.etree.ElementTree as ET
-from core.config import PATH_XRNS, PATH_PROJECTS
-from core.model.xrns import PROPS
-from core.lib.tracker import Note, TrackerProject
+from core.config import PATH_XRNS, PATH_PROJECTS, extract_xrns
+from core.model.xrns import PROPS, DEFAULT_INFO
+from core.lib.tracker import Note, TrackerGroup, TrackerProject
 from core.io.utils import trim_extension
 
+logger = logging.getLogger(__name__)
+
 
 class XRNSFile:
     ''' Class for XRNS file read & write operations '''
 
+    DOCUMENTS = ['Song.xml', 'Instrument.xml']
+    SAMPLES = 'SampleData/'
+
     def __init__(self) -> None:
         self.error = False
         self.source_path = ''
         self.project_path = ''
+        self.extracted = False
+        self.samples = []
         self.sample_paths = []
 
     def get_path(self, file_name, standard_path=True):
@@ -23,31 +35,69 @@ class XRNSFile:
         self.project_name = splitext(file_name)[0].split('/')[-1]
         self.project_path = PATH_PROJECTS + '/' + self.project_name
 
-    def load(self, file_name, standard_path=True):
+    def load(self, file_name, standard_path=True, extract=None):
+        ''' parses the song (or instrument) document straight from the
+            archive. samples are only listed, see extract_sample '''
+        with self.open(file_name, standard_path, extract) as fh:
+            if fh is not None:
+                return ET.parse(fh)
+
+    @contextmanager
+    def open(self, file_name, standard_path=True, extract=None):
+        ''' yields the song (or instrument) document as a file-like
+            stream from the archive (None if the archive has neither) '''
         self.get_path(file_name, standard_path)
+        self.extracted = False
+        self.samples = []
+        self.sample_paths = []
+        if not isfile(self.source_path):
+            raise FileNotFoundError('Missing XRNS: ' + self.source_path)
+        with zipfile.ZipFile(self.source_path, 'r') as zip_ref:
+            members = zip_ref.namelist()
+            self.samples = [name for name in members if
+                            name.startswith(self.SAMPLES) and
+                            not name.endswith('/')]
+            if extract_xrns if extract is None else extract:
+                self.extract_all()
+            for document in self.DOCUMENTS:
+                if document in members:
+                    with zip_ref.open(document) as fh:
+                        yield fh
+                    return
+        yield None
+
+    def _prepare_project_path(self):
         if not exists(PATH_PROJECTS):
             mkdir(PATH_PROJECTS)
         if not exists(self.project_path):
             mkdir(self.project_path)
-        full_name = self.source_path
-        if isfile(full_name):
-            with zipfile.ZipFile(full_name, 'r') as zip_ref:
-                zip_ref.extractall(self.project_path)
-        else:
-            raise FileNotFoundError('Missing XRNS: ' + self.source_path)
-        files = ['/Song.xml', '/Instrument.xml']
-        for file_name in files:
-            fpath = self.project_path + file_name
-            if isfile(fpath):
-                return ET.parse(fpath)
-        spath = self.project_path + '/SampleData'
-        if isdir(spath):
-            for item in walk(spath):
-                self.sample_paths.append(item)
+
+    def extract_all(self):
+        self._prepare_project_path()
+        with zipfile.ZipFile(self.source_path, 'r') as zip_ref:
+            zip_ref.extractall(self.project_path)
+        self.extracted = True
+        self.sample_paths = [
+            join(self.project_path, name) for name in self.samples]
+
+    def extract_sample(self, name):
+        ''' extracts a single sample on demand, returns its local path '''
+        if name not in self.samples:
+            raise FileNotFoundError('Missing sample: ' + name)
+        path = join(self.project_path, name)
+        if not isfile(path):
+            self._prepare_project_path()
+            with zipfile.ZipFile(self.source_path, 'r') as zip_ref:
+                path = zip_ref.extract(name, self.project_path)
+        if path not in self.sample_paths:
+            self.sample_paths.append(path)
+        return path
 
     def save(self, file_name, tree):
         if not isinstance(tree, ET.ElementTree):
             return False
+        if not self.extracted:
+            self.extract_all()
         tree.write(self.project_path + '/Song.xml')
         zipdat = zipfile.ZipFile(
             self.source_path, 'w', zipfile.ZIP_DEFLATED)
@@ -84,23 +134,79 @@ class Properties:
 
 
 class XRNS:
-    ''' Class to extract / inject relevant data from / to an XRNS file '''
+    ''' Class to extract / inject relevant data from / to an XRNS file.
+        In lazy mode the notes of a phrase are only decoded when its
+        pattern is first accessed '''
 
-    def __init__(self) -> None:
+    def __init__(self, lazy=False) -> None:
         super().__init__()
+        self.lazy = lazy
         self.source = XRNSFile()
         self.tree = ET.ElementTree()
         self.global_info = {}
 
-    def load(self, filename, standard_path=True):
+    def load(self, filename, standard_path=True, extract=None):
         self.project = TrackerProject()
-        self.tree = self.source.load(filename, standard_path)
+        self.global_info = {}
+        self.tree = self.source.load(filename, standard_path, extract)
         self.root = self.tree.getroot()
         self.get_data()
         if self.tree is None:
             return False
         return True
 
+    def stream(self, filename, standard_path=True, extract=None):
+        ''' same result as load, but phrases are extracted incrementally
+            (see iter_groups) so the whole song is never held in memory '''
+        self.project = TrackerProject()
+        self.tree = None
+        self.global_info = {}
+        with self.source.open(filename, standard_path, extract) as fh:
+            if fh is None:
+                return False
+            try:
+                for group in self.iter_groups(fh):
+                    self.project.add_group(group)
+            except KeyError as e:
+                raise KeyError(f'Invalid XRNS format. {e}')
+        self.project.add_info(self.get_info())
+        return True
+
+    def load_library(self, folder, workers=None):
+        ''' merges the instruments (.xrni) of a folder into one project,
+            one group per instrument. the files are loaded concurrently,
+            the ones that can't be read are skipped '''
+        paths = sorted(join(folder, file) for file in listdir(folder)
+                       if file.endswith('.xrni'))
+
+        def load(path):
+            xrns = XRNS(lazy=self.lazy)
+            try:
+                xrns.load(path, standard_path=False)
+            except (OSError, KeyError, AttributeError, ET.ParseError,
+                    zipfile.BadZipFile) as e:
+                logger.warning(f"Can't load instrument '{path}': {e}")
+                return []
+            return xrns.project.get_groups()
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            instruments = list(pool.map(load, paths))
+        self.source.get_path(folder.rstrip('/'), standard_path=False)
+        self.project = TrackerProject()
+        self.tree = None
+        self.global_info = {}
+        names = set()
+        for groups in instruments:
+            for group in groups:
+                name, number = group.name, 1
+                while group.name in names:
+                    number += 1
+                    group.name = f'{name} {number}'
+                names.add(group.name)
+                self.project.add_group(group)
+        self.project.add_info(self.get_info())
+        return bool(self.project.get_groups())
+
     def get_original_path(self):
         return trim_extension(self.source.source_path)
 
@@ -110,7 +216,7 @@ class XRNS:
             phrases = self.get_phrases()
         except KeyError as e:
             raise KeyError(f'Invalid XRNS format. {e}')
-        self.project.add_info(self.global_info.values)
+        self.project.add_info(self.get_info())
         self.project.add_groups(phrases)
 
     def get_global_info(self):
@@ -119,33 +225,35 @@ class XRNS:
                 self.root.find('GlobalSongData'),
                 PROPS['global'])
 
-    def parse_phrase(self, phrase):
+    def get_info(self):
+        ''' global song data, defaults for instruments '''
+        if isinstance(self.global_info, Properties):
+            return self.global_info.values
+        return {**DEFAULT_INFO, 'title': self.source.project_name}
 
-        def add_note(notecolumn):
-            note = Note()
+    def parse_line(self, line):
+        ''' collects the note columns of a phrase line in a single pass '''
+        cnotes = []
+        for notecolumn in line.iter('NoteColumn'):
             if len(notecolumn) == 0:
-                # note.midi = None
                 cnotes.append(None)
-                return
-            else:
-                noteItem = notecolumn.find('Note')
-                if noteItem is not None:
-                    note.midi = Note.get_midi(noteItem.text)
-                    vel = notecolumn.find('Volume')
-                    note.velocity = int(
-                        vel.text, 16) if vel is not None else 80
-                    cnotes.append(note)
+                continue
+            noteItem = notecolumn.find('Note')
+            if noteItem is not None:
+                note = Note()
+                note.midi = Note.get_midi(noteItem.text)
+                vel = notecolumn.find('Volume')
+                note.velocity = int(
+                    vel.text, 16) if vel is not None else 80
+                cnotes.append(note)
+        return cnotes
 
+    def parse_phrase(self, phrase):
         try:
             notes = {}
             for lines in phrase.iter('Lines'):
                 for line in lines.iter('Line'):
-                    step = line.attrib['index']
-                    for idx, column in enumerate(line.iter('NoteColumns')):
-                        cnotes = []
-                        for notecolumn in line.iter('NoteColumn'):
-                            add_note(notecolumn)
-                    notes[int(step)] = cnotes
+                    notes[int(line.attrib['index'])] = self.parse_line(line)
         except AttributeError as e:
             raise AttributeError(f'Invalid XRNS format. {e}')
         return notes
@@ -157,28 +265,85 @@ class XRNS:
                 phrase_info = Properties(
                     phrase, PROPS['phrase']
                 )
-                notes = self.parse_phrase(phrase)
-                # print([note.midi for note in notes.values()])
+                # in lazy mode the phrase element is kept for decoding.
+                # streaming clears the instrument, not its phrases
+                notes = partial(self.parse_phrase, phrase) if self.lazy \
+                    else self.parse_phrase(phrase)
                 phrases_in_instrument.append({
                     **phrase_info.values,
                     'notes': notes})
         return phrases_in_instrument
 
+    def parse_instrument(self, instrument, default_name=''):
+        try:
+            instrument_name = instrument.find('Name').text
+        except:
+            instrument_name = ''
+        instrument_name = instrument_name or default_name
+        if instrument_name:
+            return {
+                'name': instrument_name,
+                'phrases': self.parse_phrase_generator(instrument),
+                # only computed if a conversion cache asks for it
+                'digest': partial(self.get_digest,
+                                  instrument.findall('PhraseGenerator'))
+            }
+
+    def get_digest(self, generators):
+        ''' hash of the phrase XML of an instrument '''
+        digest = sha1()
+        for generator in generators:
+            digest.update(ET.tostring(generator))
+        return digest.hexdigest()
+
     def get_phrases(self):
         if self.root.tag == 'RenoiseInstrument':
-            self.parse_phrase_generator(self.root)
-            return
+            group = self.parse_instrument(
+                self.root, self.source.project_name)
+            return [group] if group else []
         for instruments in self.root.iter('Instruments'):
             phrases = []
             for instrument in instruments.iter('Instrument'):
-                try:
-                    instrument_name = instrument.find('Name').text
-                except:
-                    instrument_name = ''
-                if instrument_name:
-                    phrases.append({
-                        'name': instrument_name,
-                        'phrases':
-                            self.parse_phrase_generator(instrument)
-                    })
+                group = self.parse_instrument(instrument)
+                if group:
+                    phrases.append(group)
         return phrases
+
+    def iter_groups(self, source):
+        ''' incrementally parses a song document and yields a TrackerGroup
+            as soon as its <Instrument> element is closed. finished
+            elements are cleared, only the global song data and the name
+            and phrases of the instrument being parsed are kept '''
+        tags = []
+        for event, elem in ET.iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                tags.append(elem.tag)
+                continue
+            tags.pop()
+            depth = len(tags)
+            if depth == 0:
+                if elem.tag == 'RenoiseInstrument':
+                    group = self.parse_instrument(
+                        elem, self.source.project_name)
+                    if group:
+                        yield TrackerGroup(**group)
+                elem.clear()
+                continue
+            if tags[0] == 'RenoiseInstrument' and (
+                    tags[1] if depth > 1 else elem.tag) in [
+                    'Name', 'PhraseGenerator']:
+                continue
+            if depth == 1 and elem.tag == 'GlobalSongData':
+                self.global_info = Properties(elem, PROPS['global'])
+            elif depth == 2 and tags[1] == 'Instruments' and (
+                    elem.tag == 'Instrument'):
+                group = self.parse_instrument(elem)
+                if group:
+                    yield TrackerGroup(**group)
+            elif depth >= 2 and tags[1] == 'GlobalSongData':
+                continue
+            elif depth >= 3 and tags[1:3] == ['Instruments', 'Instrument']:
+                branch = tags[3] if depth > 3 else elem.tag
+                if branch in ['Name', 'PhraseGenerator']:
+                    continue
+            elem.clear()
@@ -1,12 +1,456 @@
+import os
+import re
 import shutil
-import base64
-from os.path import splitext, exists
-from json import JSONDecoder, JSONEncoder
-from core.config import create_backup, vertical_zoom, PATH_BASE, PATH_DATA
+import binascii
+from hashlib import blake2b
+from collections import Counter
+from os.path import dirname, splitext, exists
+from json import JSONEncoder, loads
+from core.config import backups, vertical_zoom, PATH_BASE, PATH_DATA
+from core.lib.riff import (
+    COUNT, ZynseqFile, iter_blocks, parse_bank, parse_pattern)
 import logging
 
 logger = logging.getLogger(__name__)
 
+RIFF_KEY = 'zynseq_riff_b64'
+# bytes of RIFF data encoded at once (a multiple of 3, base64 needs no
+# padding between the chunks)
+CHUNK_SIZE = 3 * 64 * 1024
+
+TOKEN = re.compile(rb'["{}\[\]]')
+STRING = re.compile(rb'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+KEY = re.compile(rb'\s*"')
+COLON = re.compile(rb'\s*:\s*')
+SCALAR = re.compile(rb'[^,}\s]*')
+SEPARATOR = re.compile(rb'\s*([,}])')
+EMPTY = re.compile(rb'\s*\{\s*$')
+EMPTY_END = re.compile(rb'\s*\}')
+
+
+def get_string_end(data, start):
+    ''' position after the closing quote of the string starting at start
+        (after its opening quote) '''
+    end = data.index(b'"', start)
+    if data.find(b'\\', start, end) == -1:
+        return end + 1
+    return STRING.match(data, start).end()
+
+
+def get_value_end(data, start):
+    ''' position after the JSON value starting at start '''
+    first = data[start:start + 1]
+    if first == b'"':
+        return get_string_end(data, start + 1)
+    if first not in (b'{', b'['):
+        return SCALAR.match(data, start).end()
+    depth = 0
+    match = TOKEN.search(data, start)
+    while match:
+        position = match.end()
+        if match.group() == b'"':
+            position = get_string_end(data, position)
+        else:
+            depth += 1 if match.group() in b'{[' else -1
+            if not depth:
+                return position
+        match = TOKEN.search(data, position)
+    raise ValueError('Unterminated JSON value')
+
+
+def iter_keys(data):
+    ''' (key, start, end) of the values of the top level keys in the JSON
+        bytes of a snapshot. the values are not decoded '''
+    position = data.index(b'{') + 1
+    if EMPTY_END.match(data, position):
+        return
+    while True:
+        match = KEY.match(data, position)
+        if not match:
+            raise ValueError(f'Expecting a key at {position}')
+        end = get_string_end(data, match.end())
+        key = loads(data[match.end() - 1:end])
+        match = COLON.match(data, end)
+        if not match:
+            raise ValueError(f'Expecting a colon at {end}')
+        start = match.end()
+        end = get_value_end(data, start)
+        yield key, start, end
+        match = SEPARATOR.match(data, end)
+        if not match:
+            raise ValueError(f'Expecting a separator at {end}')
+        if match.group(1) == b'}':
+            return
+        position = match.end()
+
+
+def find_riff(data):
+    ''' span of the base64 RIFF string (without quotes) in the JSON bytes
+        of a snapshot, None if it has no sequencer data '''
+    for key, start, end in iter_keys(data):
+        if key == RIFF_KEY and data[start:start + 1] == b'"':
+            return start + 1, end - 1
+    return None
+
+
+def decode_riff(data, start, end):
+    ''' decodes the base64 RIFF string of a snapshot from its span '''
+    if data.find(b'\\', start, end) == -1:
+        return binascii.a2b_base64(memoryview(data)[start:end])
+    # escaped in JSON, e.g. the line breaks of base64.encodebytes
+    return binascii.a2b_base64(loads(data[start - 1:end + 1]))
+
+
+def read_snapshot(file_path, riff=True, keys=None):
+    ''' the snapshot without its RIFF data (the key is kept empty) and
+        the decoded RIFF data (if riff is set). only the values of the
+        keys listed are decoded (all of them if keys is None) '''
+    with open(file_path, 'rb') as fh:
+        data = fh.read()
+    logger.debug(f"Loading snapshot {file_path} ({len(data)} bytes)")
+    snapshot = {}
+    riff_data = None
+    for key, start, end in iter_keys(data):
+        if key == RIFF_KEY and data[start:start + 1] == b'"':
+            if keys is None or key in keys:
+                snapshot[key] = ''
+            if riff:
+                riff_data = decode_riff(data, start + 1, end - 1)
+        elif keys is None or key in keys:
+            snapshot[key] = loads(data[start:end])
+    return snapshot, riff_data
+
+
+def read_riff(file_path):
+    ''' RIFF data of a snapshot, None if missing or invalid '''
+    try:
+        return read_snapshot(file_path, keys=())[1]
+    except (OSError, ValueError):
+        return None
+
+
+def write_snapshot(fh, snapshot, riff_data):
+    ''' writes the snapshot to a binary file, the RIFF data is encoded
+        chunk by chunk as the value of its key '''
+    encode = JSONEncoder().encode
+    keys = list(snapshot)
+    if RIFF_KEY not in snapshot:
+        keys.append(RIFF_KEY)
+    fh.write(b'{')
+    for number, key in enumerate(keys):
+        separator = ', ' if number else ''
+        fh.write(f'{separator}{encode(key)}: '.encode())
+        if key != RIFF_KEY:
+            fh.write(encode(snapshot[key]).encode())
+            continue
+        fh.write(b'"')
+        write_b64(fh, riff_data)
+        fh.write(b'"')
+    fh.write(b'}')
+
+
+def write_b64(fh, data):
+    view = memoryview(data)
+    for start in range(0, len(view), CHUNK_SIZE):
+        fh.write(binascii.b2a_base64(
+            view[start:start + CHUNK_SIZE], newline=False))
+
+
+def write_merged(fh, data, riff_data, encoded=False):
+    ''' writes the JSON bytes of a snapshot with its RIFF string replaced,
+        everything else is copied as is. encoded RIFF data is already in
+        base64 '''
+    def write_riff(fh):
+        if encoded:
+            fh.write(riff_data)
+        else:
+            write_b64(fh, riff_data)
+
+    view = memoryview(data)
+    span = find_riff(data)
+    if span is None:
+        # no sequencer data yet, added as the last key
+        end = data.rindex(b'}')
+        separator = '' if EMPTY.match(data, 0, end) else ', '
+        fh.write(view[:end])
+        fh.write(f'{separator}"{RIFF_KEY}": "'.encode())
+        write_riff(fh)
+        fh.write(b'"')
+    else:
+        start, end = span
+        fh.write(view[:start])
+        write_riff(fh)
+    fh.write(view[end:])
+
+
+def write_atomic(file_path, write):
+    ''' write(fh) fills a temporary file which replaces the file (after
+        its backup), a crash never leaves a truncated file behind '''
+    temp_path = file_path + '.tmp'
+    try:
+        with open(temp_path, 'wb') as fh:
+            write(fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+        if exists(file_path) and backups:
+            rotate_backups(file_path, backups)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if exists(temp_path):
+            os.remove(temp_path)
+        raise
+    sync_folder(dirname(file_path))
+
+
+def get_backup_path(file_path, number=0):
+    base = splitext(file_path)[0]
+    return f'{base}.bak' if number == 0 else f'{base}.{number}.bak'
+
+
+def rotate_backups(file_path, count):
+    ''' shifts the backups of a file (the oldest one is dropped) and makes
+        the file the newest backup. the file is hardlinked if possible: it
+        is replaced and not rewritten on save, so the backup is free '''
+    for number in range(count - 1, 0, -1):
+        if exists(get_backup_path(file_path, number - 1)):
+            os.replace(get_backup_path(file_path, number - 1),
+                       get_backup_path(file_path, number))
+    backup_path = get_backup_path(file_path)
+    if exists(backup_path):
+        os.remove(backup_path)
+    try:
+        os.link(file_path, backup_path)
+    except OSError:
+        shutil.copy2(file_path, backup_path)
+
+
+def sync_folder(folder):
+    ''' makes a rename in the folder durable (not supported on windows) '''
+    try:
+        fd = os.open(folder or '.', os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def get_block_digests(data):
+    ''' digest and content of the blocks of a RIFF payload by (block id,
+        pattern / bank id). other blocks are keyed by their position '''
+    blocks = {}
+    for index, (block_id, block) in enumerate(iter_blocks(memoryview(data))):
+        if block_id == b'patn':
+            key = ('patn', COUNT.unpack_from(block)[0])
+        elif block_id == b'bank':
+            key = ('bank', block[0])
+        else:
+            key = (block_id.decode('latin-1'), index)
+        blocks[key] = (blake2b(block, digest_size=16).digest(), block)
+    return blocks
+
+
+class SnapshotDiff:
+    ''' Changes between two RIFF payloads by bank, sequence, track and
+        pattern, with the notes added to and removed from patterns.
+        Blocks are compared by digest first, only changed blocks (and
+        the banks, if a pattern changed) are decoded. '''
+
+    def __init__(self, old, new):
+        # (target, change, detail) tuples
+        self.changes = []
+        # added and removed [step, note, velocity, duration] by target
+        self.notes = {}
+        if old == new:
+            return
+        self.old = get_block_digests(old)
+        self.new = get_block_digests(new)
+        self.old_version = self._get_version(self.old)
+        self.new_version = self._get_version(self.new)
+        self._diff_version()
+        self._diff_patterns()
+        self._diff_banks()
+        for key in sorted(set(self.old) | set(self.new)):
+            if key[0] not in ('vers', 'patn', 'bank') and \
+                    self._get_digest(self.old, key) != \
+                    self._get_digest(self.new, key):
+                self.changes.append((f'{key[0]} block', 'changed', ''))
+
+    def __bool__(self):
+        return bool(self.changes)
+
+    def __len__(self):
+        return len(self.changes)
+
+    def get_report(self):
+        return [f'{target} {change}' + (f': {detail}' if detail else '')
+                for target, change, detail in self.changes]
+
+    def _get_version(self, blocks):
+        riff = ZynseqFile()
+        vers = [block for key, (_, block) in blocks.items()
+                if key[0] == 'vers']
+        if vers:
+            riff._parse_version(vers[0])
+        return riff
+
+    @staticmethod
+    def _get_digest(blocks, key):
+        return blocks[key][0] if key in blocks else None
+
+    def _diff_version(self):
+        old, new = self.old_version, self.new_version
+        for name in ('tempo', 'beats_per_bar', 'trigger_channel',
+                     'trigger_device'):
+            if getattr(old, name) != getattr(new, name):
+                self.changes.append((name.replace('_', ' '), 'changed',
+                                     f'{getattr(old, name)} -> '
+                                     f'{getattr(new, name)}'))
+
+    def _get_pattern(self, blocks, version, pattern_id):
+        if ('patn', pattern_id) not in blocks:
+            return None
+        return parse_pattern(blocks['patn', pattern_id][1], version.version)
+
+    def _get_content(self, blocks, pattern_id):
+        ''' digest of a pattern without its id '''
+        if ('patn', pattern_id) not in blocks:
+            return None
+        block = blocks['patn', pattern_id][1]
+        return blake2b(block[COUNT.size:], digest_size=16).digest()
+
+    def _diff_notes(self, target, old, new):
+        ''' detail of a changed pattern (None if the notes are the same) '''
+        old_notes = Counter(tuple(note) for note in old.get_notes())
+        new_notes = Counter(tuple(note) for note in new.get_notes())
+        added = list((new_notes - old_notes).elements())
+        removed = list((old_notes - new_notes).elements())
+        details = []
+        if added or removed:
+            self.notes[target] = (sorted(added), sorted(removed))
+            details.append(f'+{len(added)} -{len(removed)} notes')
+        for name in ('beats', 'steps_per_beat', 'scale', 'tonic',
+                     'ref_note'):
+            if getattr(old, name) != getattr(new, name):
+                details.append(f'{name.replace("_", " ")} '
+                               f'{getattr(old, name)} -> '
+                               f'{getattr(new, name)}')
+        if not details and list(old.iter_events()) != \
+                list(new.iter_events()):
+            details.append('events changed')
+        return ', '.join(details) or None
+
+    def _diff_patterns(self):
+        ids = sorted({key[1] for key in set(self.old) | set(self.new)
+                      if key[0] == 'patn'})
+        self.patterns_changed = False
+        for pattern_id in ids:
+            key = ('patn', pattern_id)
+            if self._get_digest(self.old, key) == \
+                    self._get_digest(self.new, key):
+                continue
+            self.patterns_changed = True
+            old = self._get_pattern(self.old, self.old_version, pattern_id)
+            new = self._get_pattern(self.new, self.new_version, pattern_id)
+            target = f'pattern {pattern_id}'
+            if old is None:
+                self.changes.append(
+                    (target, 'added', f'{len(new.get_notes())} notes'))
+            elif new is None:
+                self.changes.append((target, 'removed', ''))
+            else:
+                detail = self._diff_notes(target, old, new)
+                if detail:
+                    self.changes.append((target, 'changed', detail))
+
+    def _get_bank(self, blocks, version, bank_id):
+        if ('bank', bank_id) not in blocks:
+            return None
+        return parse_bank(blocks['bank', bank_id][1], version.version)
+
+    def _diff_banks(self):
+        ids = sorted({key[1] for key in set(self.old) | set(self.new)
+                      if key[0] == 'bank'})
+        for bank_id in ids:
+            key = ('bank', bank_id)
+            if self._get_digest(self.old, key) == \
+                    self._get_digest(self.new, key) and \
+                    not self.patterns_changed:
+                continue
+            old = self._get_bank(self.old, self.old_version, bank_id)
+            new = self._get_bank(self.new, self.new_version, bank_id)
+            target = f'bank {bank_id}'
+            if old is None:
+                self.changes.append(
+                    (target, 'added', f'{len(new.sequences)} sequences'))
+            elif new is None:
+                self.changes.append((target, 'removed', ''))
+            else:
+                for index in range(max(len(old.sequences),
+                                       len(new.sequences))):
+                    self._diff_sequence(
+                        f'sequence {bank_id}/{index}',
+                        old.sequences[index] if index < len(old.sequences)
+                        else None,
+                        new.sequences[index] if index < len(new.sequences)
+                        else None)
+
+    def _diff_sequence(self, target, old, new):
+        if old is None:
+            self.changes.append((target, 'added', repr(new.name)))
+            return
+        if new is None:
+            self.changes.append((target, 'removed', repr(old.name)))
+            return
+        details = [f'{name.replace("_", " ")} {getattr(old, name)!r} -> '
+                   f'{getattr(new, name)!r}'
+                   for name in ('name', 'play_mode', 'group', 'trigger',
+                                'timebase')
+                   if getattr(old, name) != getattr(new, name)]
+        if details:
+            self.changes.append((target, 'changed', ', '.join(details)))
+        target = target.replace('sequence', 'track')
+        for index in range(max(len(old.tracks), len(new.tracks))):
+            if index >= len(new.tracks):
+                self.changes.append((f'{target}/{index}', 'removed', ''))
+            elif index >= len(old.tracks):
+                self.changes.append((f'{target}/{index}', 'added', ''))
+            else:
+                self._diff_track(f'{target}/{index}', old.tracks[index],
+                                 new.tracks[index])
+
+    def _diff_track(self, target, old, new):
+        details = [f'{name} {getattr(old, name)} -> {getattr(new, name)}'
+                   for name in ('channel', 'output', 'map')
+                   if getattr(old, name) != getattr(new, name)]
+        old_patterns = {position: pattern_id
+                        for position, pattern_id in old.patterns}
+        new_patterns = {position: pattern_id
+                        for position, pattern_id in new.patterns}
+        for position in sorted(set(old_patterns) | set(new_patterns)):
+            if position not in new_patterns:
+                details.append(f'pattern removed at {position}')
+            elif position not in old_patterns:
+                details.append(f'pattern added at {position}')
+            elif self._get_content(self.old, old_patterns[position]) != \
+                    self._get_content(self.new, new_patterns[position]):
+                old_pattern = self._get_pattern(
+                    self.old, self.old_version, old_patterns[position])
+                new_pattern = self._get_pattern(
+                    self.new, self.new_version, new_patterns[position])
+                if old_pattern is None or new_pattern is None:
+                    details.append(f'pattern replaced at {position}')
+                    continue
+                detail = self._diff_notes(
+                    f'{target}@{position}', old_pattern, new_pattern)
+                if detail:
+                    details.append(f'{detail} at {position}')
+        if details:
+            self.changes.append((target, 'changed', ', '.join(details)))
+
 
 class SnapshotManager:
     def __init__(self):
@@ -15,25 +459,21 @@ class SnapshotManager:
     def load_snapshot(self, file_path, load_sequence=True):
         self.fpath = file_path
         try:
-            with open(file_path, "r") as fh:
-                json = fh.read()
-                logger.debug(f"Loading snapshot {file_path}")
-                logger.debug(f"=> {json}")
-
-        except Exception as e:
+            snapshot, binary_riff_data = read_snapshot(
+                file_path, riff=load_sequence)
+        except OSError as e:
             logger.error("Can't load snapshot '%s': %s" % (file_path, e))
             return False
+        except ValueError as e:
+            logger.error("Invalid snapshot '%s': %s" % (file_path, e))
+            return False
 
         try:
-            snapshot = JSONDecoder().decode(json)
             self.snapshot = snapshot
-            if "zynseq_riff_b64" in snapshot:
-                b64_bytes = snapshot["zynseq_riff_b64"].encode("utf-8")
-                binary_riff_data = base64.decodebytes(b64_bytes)
-                if not load_sequence:
-                    return True
-            else:
+            if RIFF_KEY not in snapshot:
                 return False
+            if not load_sequence:
+                return True
             self.restore_riff_data(binary_riff_data)
             return True
 
@@ -50,18 +490,41 @@ class SnapshotManager:
 
     def save_snapshot(self, file_path=None):
         file_path = self.fpath if file_path is None else file_path
-        if exists(file_path) and create_backup:
-            shutil.copy2(file_path, splitext(file_path)[0] + '.bak')
         try:
             self.libseq.setVerticalZoom(vertical_zoom)
             riff_data = self.get_riff_data()
-            self.snapshot["zynseq_riff_b64"] = base64.encodebytes(
-                riff_data).decode("utf-8").replace('\n', '')
-
-            with open(file_path, "w") as fh:
-                data = JSONEncoder().encode(self.snapshot)
-                fh.write(data)
+            write_atomic(file_path, lambda fh: write_snapshot(
+                fh, self.snapshot, riff_data))
 
         except Exception as e:
             logger.error("Can't write snapshot '%s': %s" % (file_path, e))
             return False
+        return True
+
+    def merge_snapshot(self, file_path, target_path=None, riff_path=None):
+        ''' writes the snapshot of file_path (to target_path) with only its
+            RIFF data replaced, the other keys are neither decoded nor
+            encoded again. the RIFF data is taken from the sequencer, or
+            copied in base64 from the snapshot riff_path (the sequencer
+            is not used then) '''
+        target_path = file_path if target_path is None else target_path
+        try:
+            if riff_path is None:
+                self.libseq.setVerticalZoom(vertical_zoom)
+                riff_data = self.get_riff_data()
+            else:
+                with open(riff_path, 'rb') as fh:
+                    source = fh.read()
+                span = find_riff(source)
+                if span is None:
+                    raise ValueError(f'no sequencer data in {riff_path}')
+                riff_data = memoryview(source)[span[0]:span[1]]
+            with open(file_path, 'rb') as fh:
+                data = fh.read()
+            write_atomic(target_path, lambda fh: write_merged(
+                fh, data, riff_data, encoded=riff_path is not None))
+
+        except Exception as e:
+            logger.error("Can't merge snapshot '%s': %s" % (file_path, e))
+            return False
+        return True
@@ -66,6 +66,7 @@ bool g_bPatternModified = false; // True if pattern has changed since last check
 size_t g_nPlayingSequences = 0; // Quantity of playing sequences
 uint32_t g_nXruns = 0;
 bool g_bDirty = false; // True if anything has been modified
+uint32_t g_nChanges = 0; // Quantity of changes since init (not reset by save)
 std::set<std::string> g_setTransportClient; // Set of timebase clients having requested transport play
 bool g_bClientPlaying = false; // True if any external client has requested transport play
 bool g_bMidiRecord = false; // True to add notes to current pattern from MIDI input
@@ -713,11 +714,23 @@ void init(char* name) {
     selectPattern(1);
 }
 
+// Flag as modified and count the change
+void setDirty()
+{
+    g_bDirty = true;
+    ++g_nChanges;
+}
+
 bool isModified()
 {
     return g_bDirty;
 }
 
+uint32_t getChangeCount()
+{
+    return g_nChanges;
+}
+
 int fileWrite8(uint8_t value, FILE *pFile)
 {
     int nResult = fwrite(&value, 1, 1, pFile);
@@ -784,6 +797,7 @@ bool load(const char* filename)
 {
     g_pSequence = NULL;
     g_seqMan.init();
+    ++g_nChanges;
     uint32_t nVersion = 0;
     FILE *pFile;
     pFile = fopen(filename, "r");
@@ -1050,6 +1064,7 @@ bool load_pattern(uint32_t nPattern, const char* filename)
     }
     fclose(pFile);
     //printf("Ver: %d Loaded %lu pattern from file %s\n", nVersion, m_mPatterns.size(), filename);
+    ++g_nChanges;
     return true;
 }
 
@@ -1201,6 +1216,13 @@ void save(const char* filename)
     g_bDirty = false;
 }
 
+void save_copy(const char* filename)
+{
+    bool bDirty = g_bDirty;
+    save(filename);
+    g_bDirty = bDirty;
+}
+
 void save_pattern(uint32_t nPattern, const char* filename)
 {
     //!@todo Need to save / load ticks per beat (unless we always use 1920)
@@ -1421,7 +1443,7 @@ uint8_t getTriggerDevice()
 void setTriggerDevice(uint8_t idev)
 {
     g_seqMan.setTriggerDevice(idev);
-    g_bDirty = true;
+    setDirty();
 }
 
 uint8_t getTriggerChannel()
@@ -1432,7 +1454,7 @@ uint8_t getTriggerChannel()
 void setTriggerChannel(uint8_t channel)
 {
     g_seqMan.setTriggerChannel(channel);
-    g_bDirty = true;
+    setDirty();
 }
 
 uint8_t getTriggerNote(uint8_t bank, uint8_t sequence)
@@ -1443,7 +1465,7 @@ uint8_t getTriggerNote(uint8_t bank, uint8_t sequence)
 void setTriggerNote(uint8_t bank, uint8_t sequence, uint8_t note)
 {
     g_seqMan.setTriggerNote(bank, sequence, note);
-    g_bDirty = true;
+    setDirty();
 }
 
 uint16_t getTriggerSequence(uint8_t note)
@@ -1461,6 +1483,7 @@ uint32_t createPattern()
 void cleanPatterns()
 {
     g_seqMan.cleanPatterns();
+    ++g_nChanges;
 }
 
 void toggleMute(uint8_t bank, uint8_t sequence, uint32_t track)
@@ -1535,7 +1558,7 @@ void setBeatsInPattern(uint32_t beats)
     g_seqMan.getPattern(g_nPattern)->setBeatsInPattern(beats);
     g_seqMan.updateAllSequenceLengths();
     setPatternModified(g_seqMan.getPattern(g_nPattern), true);
-    g_bDirty = true;
+    setDirty();
 }
 
 uint32_t getClocksPerStep()
@@ -1558,7 +1581,7 @@ void setStepsPerBeat(uint32_t steps)
         return;
     g_seqMan.getPattern(g_nPattern)->setStepsPerBeat(steps);
     setPatternModified(g_seqMan.getPattern(g_nPattern), true);
-    g_bDirty = true;
+    setDirty();
 }
 
 bool addNote(uint32_t step, uint8_t note, uint8_t velocity, float duration)
@@ -1567,19 +1590,44 @@ bool addNote(uint32_t step, uint8_t note, uint8_t velocity, float duration)
         return false;
     if(g_seqMan.getPattern(g_nPattern)->addNote(step, note, velocity, duration)) {
         setPatternModified(g_seqMan.getPattern(g_nPattern), true);
-        g_bDirty = true;
+        setDirty();
         return true;
     }
     return false;
 }
 
+uint32_t addNotes(PATTERN_EVENT* events, uint32_t count, int8_t* transpose)
+{
+    Pattern* pPattern = g_seqMan.getPattern(g_nPattern);
+    if(!pPattern || !events)
+        return 0;
+    uint32_t nAdded = 0;
+    for(uint32_t nEvent = 0; nEvent < count; ++nEvent)
+    {
+        PATTERN_EVENT* pEvent = events + nEvent;
+        int nNote = pEvent->value1start;
+        if(transpose && nNote < 128)
+            nNote += transpose[nNote];
+        if(nNote < 0 || nNote > 127)
+            continue;
+        if(pPattern->addNote(pEvent->step, nNote, pEvent->value2start, pEvent->duration))
+            ++nAdded;
+    }
+    if(nAdded)
+    {
+        setPatternModified(pPattern, true);
+        setDirty();
+    }
+    return nAdded;
+}
+
 void removeNote(uint32_t step, uint8_t note)
 {
     if(!g_seqMan.getPattern(g_nPattern))
         return;
     setPatternModified(g_seqMan.getPattern(g_nPattern), true);
     g_seqMan.getPattern(g_nPattern)->removeNote(step, note);
-    g_bDirty = true;
+    setDirty();
 }
 
 int32_t getNoteStart(uint32_t step, uint8_t note)
@@ -1602,7 +1650,7 @@ void setNoteVelocity(uint32_t step, uint8_t note, uint8_t velocity)
         return;
     setPatternModified(g_seqMan.getPattern(g_nPattern), true);
     g_seqMan.getPattern(g_nPattern)->setNoteVelocity(step, note, velocity);
-    g_bDirty = true;
+    setDirty();
 }
 
 uint8_t getStutterCount(uint32_t step, uint8_t note)
@@ -1618,7 +1666,7 @@ void setStutterCount(uint32_t step, uint8_t note, uint8_t count)
         return;
     setPatternModified(g_seqMan.getPattern(g_nPattern), true);
     g_seqMan.getPattern(g_nPattern)->setStutterCount(step, note, count);
-    g_bDirty = true;
+    setDirty();
 }
 
 uint8_t getStutterDur(uint32_t step, uint8_t note)
@@ -1634,7 +1682,7 @@ void setStutterDur(uint32_t step, uint8_t note, uint8_t dur)
         return;
     setPatternModified(g_seqMan.getPattern(g_nPattern), true);
     g_seqMan.getPattern(g_nPattern)->setStutterDur(step, note, dur);
-    g_bDirty = true;
+    setDirty();
 }
 
 float getNoteDuration(uint32_t step, uint8_t note)
@@ -1644,13 +1692,40 @@ float getNoteDuration(uint32_t step, uint8_t note)
     return 0;
 }
 
+uint32_t getPatternEvents(PATTERN_EVENT* events, uint32_t size)
+{
+    Pattern* pPattern = g_seqMan.getPattern(g_nPattern);
+    if(!pPattern)
+        return 0;
+    uint32_t nEvent = 0;
+    while(StepEvent* pEvent = pPattern->getEventAt(nEvent))
+    {
+        if(events && nEvent < size)
+        {
+            PATTERN_EVENT* pExport = events + nEvent;
+            pExport->step = pEvent->getPosition();
+            pExport->duration = pEvent->getDuration();
+            pExport->command = pEvent->getCommand();
+            pExport->value1start = pEvent->getValue1start();
+            pExport->value2start = pEvent->getValue2start();
+            pExport->value1end = pEvent->getValue1end();
+            pExport->value2end = pEvent->getValue2end();
+            pExport->stutterCount = pEvent->getStutterCount();
+            pExport->stutterDur = pEvent->getStutterDur();
+            pExport->padding = 0;
+        }
+        ++nEvent;
+    }
+    return nEvent;
+}
+
 bool addProgramChange(uint32_t step, uint8_t program)
 {
     if(!g_seqMan.getPattern(g_nPattern))
         return false;
     if(g_seqMan.getPattern(g_nPattern)->addProgramChange(step, program)) {
         setPatternModified(g_seqMan.getPattern(g_nPattern), true);
-        g_bDirty = true;
+        setDirty();
         return true;
     }
     return false;
@@ -1663,7 +1738,7 @@ void removeProgramChange(uint32_t step, uint8_t program)
     if(g_seqMan.getPattern(g_nPattern)->removeProgramChange(step))
         return;
     setPatternModified(g_seqMan.getPattern(g_nPattern), true);
-    g_bDirty = true;
+    setDirty();
 }
 
 uint8_t getProgramChange(uint32_t step)
@@ -1679,7 +1754,7 @@ void transpose(int8_t value)
         return;
     setPatternModified(g_seqMan.getPattern(g_nPattern), true);
     g_seqMan.getPattern(g_nPattern)->transpose(value);
-    g_bDirty = true;
+    setDirty();
 }
 
 void changeVelocityAll(int value)
@@ -1688,7 +1763,7 @@ void changeVelocityAll(int value)
         return;
     setPatternModified(g_seqMan.getPattern(g_nPattern), true);
     g_seqMan.getPattern(g_nPattern)->changeVelocityAll(value);
-    g_bDirty = true;
+    setDirty();
 }
 
 void changeDurationAll(float value)
@@ -1697,7 +1772,7 @@ void changeDurationAll(float value)
         return;
     setPatternModified(g_seqMan.getPattern(g_nPattern), true);
     g_seqMan.getPattern(g_nPattern)->changeDurationAll(value);
-    g_bDirty = true;
+    setDirty();
 }
 
 void changeStutterCountAll(int value)
@@ -1706,7 +1781,7 @@ void changeStutterCountAll(int value)
         return;
     setPatternModified(g_seqMan.getPattern(g_nPattern), true);
     g_seqMan.getPattern(g_nPattern)->changeStutterCountAll(value);
-    g_bDirty = true;
+    setDirty();
 }
 
 void changeStutterDurAll(int value)
@@ -1715,7 +1790,7 @@ void changeStutterDurAll(int value)
         return;
     setPatternModified(g_seqMan.getPattern(g_nPattern), true);
     g_seqMan.getPattern(g_nPattern)->changeStutterDurAll(value);
-    g_bDirty = true;
+    setDirty();
 }
 
 void clear()
@@ -1724,13 +1799,13 @@ void clear()
         return;
     setPatternModified(g_seqMan.getPattern(g_nPattern), true);
     g_seqMan.getPattern(g_nPattern)->clear();
-    g_bDirty = true;
+    setDirty();
 }
 
 void copyPattern(uint32_t source, uint32_t destination)
 {
     g_seqMan.copyPattern(source, destination);
-    g_bDirty = true;
+    setDirty();
 }
 
 void setInputRest(uint8_t note)
@@ -1738,7 +1813,7 @@ void setInputRest(uint8_t note)
     if(note > 127)
         g_nInputRest = 0xFF;
     g_nInputRest = note;
-    g_bDirty = true;
+    setDirty();
 }
 
 uint8_t getInputRest()
@@ -1751,7 +1826,7 @@ void setScale(uint32_t scale)
     if(!g_seqMan.getPattern(g_nPattern))
         return;
     if(scale != g_seqMan.getPattern(g_nPattern)->getScale())
-        g_bDirty = true;
+        setDirty();
     g_seqMan.getPattern(g_nPattern)->setScale(scale);
 }
 
@@ -1767,7 +1842,7 @@ void setTonic(uint8_t tonic)
     if(!g_seqMan.getPattern(g_nPattern))
         return;
     g_seqMan.getPattern(g_nPattern)->setTonic(tonic);
-    g_bDirty = true;
+    setDirty();
 }
 
 uint8_t getTonic()
@@ -1851,15 +1926,15 @@ uint32_t getPatternPlayhead()
 bool addPattern(uint8_t bank, uint8_t sequence, uint32_t track, uint32_t position, uint32_t pattern, bool force)
 {
     bool bUpdated = g_seqMan.addPattern(bank, sequence, track, position, pattern, force);
-    if(bank + sequence)
-        g_bDirty |= bUpdated;
+    if(bank + sequence && bUpdated)
+        setDirty();
     return bUpdated;
 }
 
 void removePattern(uint8_t bank, uint8_t sequence, uint32_t track, uint32_t position)
 {
     g_seqMan.removePattern(bank, sequence, track, position);
-    g_bDirty = true;
+    setDirty();
 }
 
 uint32_t getPattern(uint8_t bank, uint8_t sequence, uint32_t track,  uint32_t position)
@@ -1895,7 +1970,7 @@ void setPlayMode(uint8_t bank, uint8_t sequence, uint8_t mode)
     Sequence* pSequence = g_seqMan.getSequence(bank, sequence);
     pSequence->setPlayMode(mode);
     if(bank + sequence)
-        g_bDirty = true;
+        setDirty();
 }
 
 uint8_t getPlayState(uint8_t bank, uint8_t sequence)
@@ -2016,7 +2091,7 @@ void clearSequence(uint8_t bank, uint8_t sequence)
 {
     Sequence* pSequence = g_seqMan.getSequence(bank, sequence);
     pSequence->clear();
-    g_bDirty = true;
+    setDirty();
 }
 
 size_t getPlayingSequences()
@@ -2030,6 +2105,7 @@ void setSequencesInBank(uint8_t bank, uint8_t sequences)
         std::this_thread::sleep_for(std::chrono::microseconds(10));
     g_bMutex = true;
     g_seqMan.setSequencesInBank(bank, sequences);
+    ++g_nChanges;
     g_bMutex = false;
     g_pSequence = g_seqMan.getSequence(0, 0);
 }
@@ -2042,6 +2118,7 @@ uint32_t getSequencesInBank(uint32_t bank)
 void clearBank(uint32_t bank)
 {
     g_seqMan.clearBank(bank);
+    ++g_nChanges;
 }
 
 
@@ -2057,7 +2134,7 @@ void setGroup(uint8_t bank, uint8_t sequence, uint8_t group)
 {
     Sequence* pSequence = g_seqMan.getSequence(bank, sequence);
     return pSequence->setGroup(group);
-    g_bDirty = true;
+    setDirty();
 }
 
 bool hasSequenceChanged(uint8_t bank, uint8_t sequence)
@@ -2067,7 +2144,7 @@ bool hasSequenceChanged(uint8_t bank, uint8_t sequence)
 
 uint32_t addTrackToSequence(uint8_t bank, uint8_t sequence, uint32_t track)
 {
-    g_bDirty = true;
+    setDirty();
     return g_seqMan.getSequence(bank, sequence)->addTrack(track);
 }
 
@@ -2077,14 +2154,14 @@ void removeTrackFromSequence(uint8_t bank, uint8_t sequence, uint32_t track)
     if(!pSequence->removeTrack(track))
         return;
     pSequence->updateLength();
-    g_bDirty = true;
+    setDirty();
 }
 
 void addTempoEvent(uint8_t bank, uint8_t sequence, uint32_t tempo, uint16_t bar, uint16_t tick)
 {
 	//!@todo Concert tempo events to use double for tempo value
     g_seqMan.getSequence(bank, sequence)->addTempo(tempo, bar, tick);
-    g_bDirty = true;
+    setDirty();
 }
 
 uint32_t getTempoAt(uint8_t bank, uint8_t sequence, uint16_t bar, uint16_t tick)
@@ -2097,7 +2174,7 @@ void addTimeSigEvent(uint8_t bank, uint8_t sequence, uint8_t beats, uint8_t type
     if(bar < 1)
         bar = 1;
     g_seqMan.getSequence(bank, sequence)->addTimeSig((beats << 8) | type, bar);
-    g_bDirty = true;
+    setDirty();
 }
 
 uint16_t getTimeSigAt(uint8_t bank, uint8_t sequence, uint16_t bar)
@@ -2133,6 +2210,7 @@ const char* getSequenceName(uint8_t bank, uint8_t sequence)
 bool moveSequence(uint8_t bank, uint8_t sequence, uint8_t position)
 {
     bool bResult = g_seqMan.moveSequence(bank, sequence, position);
+    ++g_nChanges;
     g_pSequence = g_seqMan.getSequence(0, 0);
     return bResult;
 }
@@ -2140,12 +2218,14 @@ bool moveSequence(uint8_t bank, uint8_t sequence, uint8_t position)
 void insertSequence(uint8_t bank, uint8_t sequence)
 {
     g_seqMan.insertSequence(bank, sequence);
+    ++g_nChanges;
     g_pSequence = g_seqMan.getSequence(0, 0);
 }
 
 void removeSequence(uint8_t bank, uint8_t sequence)
 {
     g_seqMan.removeSequence(bank, sequence);
+    ++g_nChanges;
     g_pSequence = g_seqMan.getSequence(0, 0);
 }
 
@@ -2172,7 +2252,7 @@ void setChannel(uint8_t bank, uint8_t sequence, uint32_t track, uint8_t channel)
         return;
     pTrack->setChannel(channel);
     if(bank + sequence)
-        g_bDirty = true;
+        setDirty();
 }
 
 uint8_t getChannel(uint8_t bank, uint8_t sequence, uint32_t track)
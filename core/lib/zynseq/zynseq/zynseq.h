@@ -65,6 +65,22 @@ enum TRANSPORT_CLOCK
     TRANSPORT_CLOCK_ANALOG = 4
 };
 
+/** @brief  Pattern event as exported by getPatternEvents (16 bytes)
+*/
+struct PATTERN_EVENT
+{
+    uint32_t step; // Index of step at which event starts
+    float duration; // Duration in steps
+    uint8_t command; // MIDI command
+    uint8_t value1start; // MIDI value 1 (e.g. note) at start of event
+    uint8_t value2start; // MIDI value 2 (e.g. velocity) at start of event
+    uint8_t value1end; // MIDI value 1 at end of event
+    uint8_t value2end; // MIDI value 2 at end of event
+    uint8_t stutterCount; // Quantity of stutters
+    uint8_t stutterDur; // Duration of each stutter in clock cycles
+    uint8_t padding;
+};
+
 // ** Library management functions **
 
 /** @brief  Initialise library and connect to jackd server
@@ -78,6 +94,12 @@ void init(char* name);
 */
 bool isModified();
 
+/** @brief  Get quantity of changes since init
+*   @retval uint32_t Quantity of changes (including loads), not reset by save
+*   @note   Compare with a previous value to check for changes since then
+*/
+uint32_t getChangeCount();
+
 /** @brief  Enable debug output
 *   @param  bEnable True to enable debug output
 */
@@ -101,6 +123,12 @@ bool load_pattern(uint32_t nPattern, const char* filename);
 */
 void save(const char* filename);
 
+/** @brief  Save sequences and patterns to file without clearing the modified flag
+*   @param  filename Full path and filename
+*   @note   Used to export the RIFF data without treating it as saved
+*/
+void save_copy(const char* filename);
+
 /** @brief  Save pattern to file
 *   @param  nPattern Pattern number
 *   @param  filename Full path and filename
@@ -333,6 +361,15 @@ void setStepsPerBeat(uint32_t steps);
 */
 bool addNote(uint32_t step, uint8_t note, uint8_t velocity, float duration);
 
+/** @brief  Add notes to selected pattern in one call
+*   @param  events Pointer to array of PATTERN_EVENT (step, value1start: note, value2start: velocity, duration)
+*   @param  count Quantity of events in array
+*   @param  transpose Pointer to array of 128 note offsets indexed by MIDI note or NULL
+*   @retval uint32_t Quantity of notes added
+*   @note   Notes transposed out of MIDI range are skipped. Other event fields are ignored.
+*/
+uint32_t addNotes(PATTERN_EVENT* events, uint32_t count, int8_t* transpose);
+
 /** @brief  Removes note from selected pattern
 *   @param  step Index of step at which to remove note
 *   @param  note MIDI note number to remove
@@ -395,6 +432,14 @@ void setStutterDur(uint32_t step, uint8_t note, uint8_t dur);
 */
 float getNoteDuration(uint32_t step, uint8_t note);
 
+/** @brief  Get all events of selected pattern in one call
+*   @param  events Pointer to array of PATTERN_EVENT to populate (may be NULL)
+*   @param  size Quantity of elements in array
+*   @retval uint32_t Quantity of events in pattern
+*   @note   Only the first size events are written. Call with size 0 to query quantity of events.
+*/
+uint32_t getPatternEvents(PATTERN_EVENT* events, uint32_t size);
+
 /** @brief  Add programme change to selected pattern
 *   @param  step Index of step at which to add program change
 *   @param  program MIDI program change number
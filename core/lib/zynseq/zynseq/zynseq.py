@@ -23,8 +23,12 @@
 #
 # ********************************************************************
 
+import os
+import atexit
 import ctypes
+import struct
 import logging
+import tempfile
 from math import sqrt
 from hashlib import new
 from os.path import dirname, realpath
@@ -76,6 +80,25 @@ SEQ_LASTPLAYSTATUS = 5
 PLAY_MODES = ['Disabled', 'Oneshot', 'Loop', 'Oneshot all', 'Loop all', 'Oneshot sync', 'Loop sync']
 
 
+# Pattern event as exported by getPatternEvents (PATTERN_EVENT in zynseq.h)
+class PatternEvent(ctypes.Structure):
+	_fields_ = [
+		("step", ctypes.c_uint32),
+		("duration", ctypes.c_float),
+		("command", ctypes.c_uint8),
+		("value1start", ctypes.c_uint8),
+		("value2start", ctypes.c_uint8),
+		("value1end", ctypes.c_uint8),
+		("value2end", ctypes.c_uint8),
+		("stutterCount", ctypes.c_uint8),
+		("stutterDur", ctypes.c_uint8),
+		("padding", ctypes.c_uint8)
+	]
+
+# Native layout of PatternEvent, used to pack notes for addNotes
+PATTERN_EVENT = struct.Struct("=IfBBBxxxxx")
+
+
 class zynseq(zynthian_engine):
 
 	# Subsignals are defined inside each module. Here we define zynseq subsignals:
@@ -83,6 +106,10 @@ class zynseq(zynthian_engine):
 	SS_SEQ_REFRESH = 2
 	SS_SEQ_PROGRESS = 3
 
+	# Per-instance scratch file used to pass RIFF data to / from the library
+	riff_fd = None
+	riff_path = None
+
 	# Initiate library - performed by zynseq module
 	def __init__(self, path=None, state_manager=None):
 		self.state_manager = state_manager
@@ -98,6 +125,15 @@ class zynseq(zynthian_engine):
 			self.libseq.setTempo.argtypes = [ctypes.c_double]
 			self.libseq.setMetronomeVolume.argtypes = [ctypes.c_float]
 			self.libseq.getMetronomeVolume.restype = ctypes.c_float
+			self.libseq.load_pattern.restype = ctypes.c_bool
+			if hasattr(self.libseq, "getPatternEvents"):
+				self.libseq.getPatternEvents.argtypes = [ctypes.POINTER(PatternEvent), ctypes.c_uint32]
+				self.libseq.getPatternEvents.restype = ctypes.c_uint32
+			if hasattr(self.libseq, "addNotes"):
+				self.libseq.addNotes.argtypes = [ctypes.POINTER(PatternEvent), ctypes.c_uint32, ctypes.POINTER(ctypes.c_int8)]
+				self.libseq.addNotes.restype = ctypes.c_uint32
+			if hasattr(self.libseq, "getChangeCount"):
+				self.libseq.getChangeCount.restype = ctypes.c_uint32
 			# self.libseq.getStateChange.argtypes = [ctypes.c_uint8, ctypes.c_uint8, ctypes.c_uint8, ctypes.POINTER(ctypes.c_uint32)]
 			# self.libseq.getStateChange.restype = ctypes.c_uint8
 			# self.libseq.getProgress.argtypes = [ctypes.c_uint8, ctypes.c_uint8, ctypes.c_uint8, ctypes.POINTER(ctypes.c_uint16)]
@@ -257,6 +293,67 @@ class zynseq(zynthian_engine):
 			return self.libseq.save_pattern(int(patnum), bytes(filename, "utf-8"))
 		return None
 
+	# Get all events of the selected pattern in one call
+	# Returns: Array of PatternEvent or None if the library does not provide getPatternEvents
+	def get_pattern_events(self):
+		if not self.libseq or not hasattr(self.libseq, "getPatternEvents"):
+			return None
+		count = self.libseq.getPatternEvents(None, 0)
+		events = (PatternEvent * count)()
+		count = self.libseq.getPatternEvents(events, count)
+		return events[:count] if count < len(events) else events
+
+	# Add notes to the selected pattern in one call
+	# notes: List of [step, note, velocity, duration]
+	# transpose: List of 128 note offsets indexed by MIDI note or None
+	# Returns: Quantity of notes added
+	def add_notes(self, notes, transpose=None):
+		if not self.libseq:
+			return 0
+		if not hasattr(self.libseq, "addNotes"):
+			added = 0
+			for step, note, velocity, duration in notes:
+				if transpose and note < 128:
+					note += transpose[note]
+				if 0 <= note <= 127 and self.libseq.addNote(step, note, velocity, duration):
+					added += 1
+			return added
+		data = b"".join(PATTERN_EVENT.pack(int(step), duration, 0x90, int(note) & 0xFF, int(velocity) & 0xFF) for step, note, velocity, duration in notes)
+		events = (PatternEvent * len(notes)).from_buffer_copy(data)
+		offsets = (ctypes.c_int8 * 128)(*transpose) if transpose else None
+		return self.libseq.addNotes(events, len(notes), offsets)
+
+	# Get content of a pattern in zynseq pattern file format
+	# patnum: Pattern number
+	# Returns: Pattern file data (empty if the pattern has no events)
+	def get_pattern_data(self, patnum):
+		fpath = self.get_riff_path()
+		try:
+			os.ftruncate(self.riff_fd, 0)
+			self.save_pattern(patnum, fpath)
+			data = os.pread(self.riff_fd, os.fstat(self.riff_fd).st_size, 0)
+			os.ftruncate(self.riff_fd, 0)
+			return data
+		except Exception as e:
+			logging.error("Can't get pattern data! => {}".format(e))
+			return None
+
+	# Replace content of a pattern with data in zynseq pattern file format
+	# patnum: Pattern number
+	# data: Pattern file data (its vers block sets beats per bar and zoom)
+	# Returns: True on success
+	def set_pattern_data(self, patnum, data):
+		fpath = self.get_riff_path()
+		try:
+			os.ftruncate(self.riff_fd, 0)
+			os.pwrite(self.riff_fd, data, 0)
+			loaded = self.libseq.load_pattern(int(patnum), bytes(fpath, "utf-8"))
+			os.ftruncate(self.riff_fd, 0)
+			return loaded
+		except Exception as e:
+			logging.error("Can't set pattern data! => {}".format(e))
+			return False
+
 	# Set sequence name
 	# name: Sequence name (truncates at 16 characters)
 	def set_sequence_name(self, bank, sequence, name):
@@ -351,15 +448,32 @@ class zynseq(zynthian_engine):
 		except Exception as e:
 			logging.error(e)
 
-	def get_riff_data(self):
-		fpath = "/tmp/snapshot.zynseq"
+	# Get path of the scratch file for RIFF data
+	# Uses an anonymous in-memory file (memfd) if available, falls back to a unique temporary file
+	def get_riff_path(self):
+		if self.riff_path is None:
+			try:
+				self.riff_fd = os.memfd_create("zynseq", os.MFD_CLOEXEC)
+				self.riff_path = "/proc/self/fd/{}".format(self.riff_fd)
+			except (AttributeError, OSError):
+				self.riff_fd, self.riff_path = tempfile.mkstemp(prefix="zynseq-", suffix=".zynseq")
+				atexit.register(os.remove, self.riff_path)
+		return self.riff_path
+
+	# Get the RIFF data of the sequencer
+	# keep_modified: True to keep the modified flag (an export, not a save)
+	def get_riff_data(self, keep_modified=False):
+		fpath = self.get_riff_path()
 		try:
-			# Save to tmp
-			self.save(fpath)
+			# Save to scratch file
+			if keep_modified and hasattr(self.libseq, "save_copy"):
+				self.libseq.save_copy(bytes(fpath, "utf-8"))
+			else:
+				self.save(fpath)
 			# Load binary data
-			with open(fpath,"rb") as fh:
-				riff_data=fh.read()
-				logging.info("Loading RIFF data...\n")
+			riff_data = os.pread(self.riff_fd, os.fstat(self.riff_fd).st_size, 0)
+			os.ftruncate(self.riff_fd, 0)
+			logging.info("Loading RIFF data...\n")
 			return riff_data
 
 		except Exception as e:
@@ -367,14 +481,16 @@ class zynseq(zynthian_engine):
 			return None
 
 	def restore_riff_data(self, riff_data):
-		fpath = "/tmp/snapshot.zynseq"
+		fpath = self.get_riff_path()
 		try:
-			# Save RIFF data to tmp file
-			with open(fpath,"wb") as fh:
-				fh.write(riff_data)
-				logging.info("Restoring RIFF data...\n")
-			# Load from tmp file
-			if self.load(fpath):
+			# Save RIFF data to scratch file
+			os.ftruncate(self.riff_fd, 0)
+			os.pwrite(self.riff_fd, riff_data, 0)
+			logging.info("Restoring RIFF data...\n")
+			# Load from scratch file
+			loaded = self.load(fpath)
+			os.ftruncate(self.riff_fd, 0)
+			if loaded:
 				self.filename = "snapshot"
 				return True
 
@@ -17,3 +17,6 @@ PROPS = {
      'NumberOfLines': '#lines'
      }
 }
+
+# project info of instruments (they have no global song data)
+DEFAULT_INFO = {'bpm': '120', 'lpb': '4'}
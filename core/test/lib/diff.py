@@ -0,0 +1,16 @@
+import sys
+import time
+from core.lib.zss import SnapshotDiff, read_snapshot
+
+# Changes between the sequencer data of two snapshots.
+# usage: python -m core.test.lib.diff old.zss new.zss
+
+old = read_snapshot(sys.argv[1])[1]
+new = read_snapshot(sys.argv[2])[1]
+start = time.perf_counter()
+diff = SnapshotDiff(old, new)
+elapsed = time.perf_counter() - start
+
+for line in diff.get_report():
+    print(line)
+print(f'{len(diff)} changes, compared in {elapsed * 1000:.2f} ms')
@@ -0,0 +1,49 @@
+import sys
+import time
+from core.lib.xrns import XRNS
+from core.audio.sequencer import Sequencer
+
+# Benchmark of the XRNS import path (Sequencer._import_groups): notes added
+# in one native call per pattern (addNotes) versus one addNote call per note.
+# usage: python -m core.test.lib.importer path/to/song.xrns [runs]
+
+
+def add_notes_each(seq):
+    ''' the previous implementation: one library call per note '''
+    def add_notes(notes, transpose=None):
+        for step, note, velocity, duration in notes:
+            if transpose and note < 128:
+                note += transpose[note]
+            seq.libseq.addNote(step, note, velocity, duration)
+    return add_notes
+
+
+def measure(seq, project, runs):
+    elapsed = 0
+    for run in range(runs):
+        seq.reset()
+        seq.select_bank(1)
+        start = time.perf_counter()
+        seq._import_groups()
+        elapsed += time.perf_counter() - start
+    return elapsed / runs, seq.get_riff_data()
+
+
+file_name = sys.argv[1]
+runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+xrns = XRNS()
+xrns.load(file_name, standard_path=False)
+seq = Sequencer()
+seq.initialize(scan=False)
+seq.import_project(file_name, xrns.project)
+
+bulk, bulk_data = measure(seq, xrns.project, runs)
+seq.add_notes = add_notes_each(seq)
+each, each_data = measure(seq, xrns.project, runs)
+
+print(f'groups: {len(xrns.project.get_groups())}, '
+      f'phrases: {xrns.project.get_total_phrases()}')
+print(f'addNote per note:  {each * 1000:8.1f} ms')
+print(f'addNotes per pattern: {bulk * 1000:5.1f} ms')
+print('identical' if bulk_data == each_data else 'MISMATCH')
@@ -0,0 +1,81 @@
+import sys
+import time
+import random
+from core.lib.layout import BankLayout, MAX_BANKS
+
+# Checks the bank layout of random projects (no overlapping sequences,
+# groups starting at the top of a column and filling consecutive slots,
+# bank limit) and times the planner on large projects.
+# usage: python -m core.test.lib.layout [projects] [seed]
+
+
+def check(layout):
+    ''' returns the list of broken rules '''
+    errors = []
+    used = set()
+    size = layout.sequences_in_bank
+    for group, phrases in enumerate(layout.groups):
+        sequences = layout.get_sequences(group)
+        if len(sequences) != phrases:
+            errors.append(f'group {group}: {len(sequences)} of {phrases}')
+        if sequences and sequences[0][1] % layout.rows:
+            errors.append(f'group {group}: not at the top of a column')
+        for number, (bank, sequence) in enumerate(sequences):
+            if (bank, sequence) in used:
+                errors.append(f'group {group}: {bank}/{sequence} is taken')
+            used.add((bank, sequence))
+            if bank in layout.reserved or not 0 <= sequence < size:
+                errors.append(f'group {group}: bad slot {bank}/{sequence}')
+            if number:
+                previous = sequences[number - 1]
+                position = layout.banks.index(bank) * size + sequence
+                if position != layout.banks.index(previous[0]) * size + \
+                        previous[1] + 1:
+                    errors.append(f'group {group}: not contiguous')
+    if len(layout.banks) > MAX_BANKS:
+        errors.append(f'{len(layout.banks)} banks')
+    return errors
+
+
+def random_project(rnd, groups):
+    return [rnd.choice([0, 1, 2, 4, 8, 12, 16, 30, 64, 100])
+            for group in range(groups)]
+
+
+projects = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+rnd = random.Random(int(sys.argv[2]) if len(sys.argv) > 2 else 0)
+failures = 0
+too_large = 0
+
+for number in range(projects):
+    groups = random_project(rnd, rnd.randint(1, 20))
+    minimum_rows = rnd.randint(2, 8)
+    try:
+        layout = BankLayout(groups, minimum_rows,
+                            minimum_rows + rnd.randint(0, 4), reserved=[10])
+    except ValueError:
+        too_large += 1
+        continue
+    errors = check(layout)
+    if errors:
+        failures += 1
+        print(f'project {number} {groups}: {errors[0]}')
+
+try:
+    BankLayout([25] * 64, reserved=[10])
+    failures += 1
+    print('bank limit not enforced')
+except ValueError:
+    pass
+
+print(f'{projects} projects ({too_large} over the bank limit), '
+      f'{failures} failures')
+
+for phrases in (100, 500, 1000):
+    groups = [rnd.randint(1, 12) for group in range(phrases // 6)]
+    start = time.perf_counter()
+    layout = BankLayout(groups, 4, 8)
+    elapsed = time.perf_counter() - start
+    print(f'{sum(groups):5} phrases in {len(groups):3} groups: '
+          f'{len(layout.banks):2} banks of {layout.sequences_in_bank} '
+          f'sequences, {elapsed * 1000:.2f} ms')
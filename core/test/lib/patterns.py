@@ -0,0 +1,59 @@
+import sys
+import glob
+import time
+import random
+import tempfile
+from os.path import getsize
+from core.config import PATH_ZSS
+from core.lib.zss import read_snapshot
+from core.lib.riff import ZynseqFile
+from core.lib.patterns import PatternLibrary, get_named_patterns, \
+    write_library
+
+# Collects the patterns of snapshots into a pattern library file, checks
+# that every pattern reads back unchanged and times random access.
+# usage: python -m core.test.lib.patterns [file.zss ...]
+
+files = sys.argv[1:] or sorted(glob.glob(PATH_ZSS + '/*.zss'))
+patterns = []
+for file_path in files:
+    data = read_snapshot(file_path)[1]
+    if data is not None:
+        patterns.extend(get_named_patterns(ZynseqFile.parse(data)))
+
+with tempfile.NamedTemporaryFile(suffix='.zpat') as fh:
+    start = time.perf_counter()
+    write_library(fh.name, patterns)
+    written = time.perf_counter() - start
+    print(f'{len(patterns)} patterns of {len(files)} snapshots written in '
+          f'{written * 1000:.1f} ms ({getsize(fh.name)} bytes)')
+
+    with PatternLibrary(fh.name) as library:
+        failures = 0
+        for index, (name, pattern) in enumerate(patterns):
+            loaded = library.get_pattern(index)
+            if library.get_name(index) != name.encode()[:16].decode(
+                    'utf-8', 'ignore') or \
+                    list(loaded.iter_events()) != \
+                    list(pattern.iter_events()) or \
+                    (loaded.beats, loaded.steps_per_beat, loaded.scale,
+                     loaded.tonic, loaded.ref_note) != \
+                    (pattern.beats, pattern.steps_per_beat, pattern.scale,
+                     pattern.tonic, pattern.ref_note):
+                failures += 1
+                print(f'MISMATCH in pattern {index} ({name})')
+        print(f'{failures} failures')
+
+        if len(library):
+            indexes = [random.randrange(len(library)) for _ in range(10000)]
+            start = time.perf_counter()
+            for index in indexes:
+                library.get_pattern(index).get_notes()
+            elapsed = time.perf_counter() - start
+            print(f'random access: {elapsed / len(indexes) * 1e6:.1f} us '
+                  f'per pattern')
+            start = time.perf_counter()
+            found = library.search(note=60)
+            elapsed = time.perf_counter() - start
+            print(f'search: {len(found)} patterns playing C4 found in '
+                  f'{elapsed * 1000:.2f} ms')
@@ -0,0 +1,33 @@
+import sys
+import json
+import glob
+import time
+import base64
+from core.config import PATH_ZSS
+from core.lib.riff import ZynseqFile, VERSION
+
+# Round trip of the RIFF payload of snapshots through the pure Python codec.
+# Files in the current format must be reproduced byte by byte.
+# usage: python -m core.test.lib.riff [file.zss ...]
+
+files = sys.argv[1:] or sorted(glob.glob(PATH_ZSS + '/*.zss'))
+
+for file_path in files:
+    with open(file_path, 'r') as fh:
+        snapshot = json.load(fh)
+    if 'zynseq_riff_b64' not in snapshot:
+        continue
+    data = base64.b64decode(snapshot['zynseq_riff_b64'])
+    start = time.perf_counter()
+    riff = ZynseqFile.parse(data)
+    elapsed = time.perf_counter() - start
+    encoded = riff.to_bytes()
+    for pattern in riff.patterns.values():
+        pattern.events
+    if riff.version == VERSION:
+        result = 'OK' if encoded == data == riff.to_bytes() else 'MISMATCH'
+    else:
+        result = f'upgraded from v{riff.version}'
+    print(f'{file_path.split("/")[-1][:30]:30} {elapsed * 1000:6.2f} ms  '
+          f'{len(riff.patterns):3} patterns {len(riff.banks):3} banks  '
+          f'{result}')
@@ -0,0 +1,265 @@
+import os
+import sys
+import socket
+import threading
+import paramiko
+from hashlib import sha256
+from paramiko import SFTPAttributes, SFTPHandle, SFTPServer, \
+    SFTPServerInterface, SFTP_OK
+
+# Local SSH/SFTP stand-in for the zynthian, serving a directory.
+# usage: python -m core.test.lib.sftpserver [root] [port]
+# then point SFTP_HOST / PATH_ZSS_REMOTE of the bridge to it, or use
+# StandInServer from code (see the self test at the bottom).
+
+USER = 'root'
+PASSWORD = 'raspberry'
+
+
+def errno_to_sftp(method):
+    def wrapper(*args):
+        try:
+            return method(*args)
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+    return wrapper
+
+
+class FileHandle(SFTPHandle):
+    def stat(self):
+        try:
+            return SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+
+    def chattr(self, attr):
+        return SFTP_OK
+
+
+class DirectoryInterface(SFTPServerInterface):
+    ''' maps remote absolute paths into the served root directory '''
+
+    def __init__(self, server, *args, **kwargs):
+        self.root = server.root
+        super().__init__(server, *args, **kwargs)
+
+    def local(self, path):
+        return self.root + self.canonicalize(path)
+
+    def canonicalize(self, path):
+        return os.path.normpath('/' + path).replace('//', '/')
+
+    @errno_to_sftp
+    def list_folder(self, path):
+        folder = self.local(path)
+        result = []
+        for name in os.listdir(folder):
+            attr = SFTPAttributes.from_stat(os.stat(os.path.join(folder, name)))
+            attr.filename = name
+            result.append(attr)
+        return result
+
+    @errno_to_sftp
+    def stat(self, path):
+        return SFTPAttributes.from_stat(os.stat(self.local(path)))
+
+    @errno_to_sftp
+    def lstat(self, path):
+        return SFTPAttributes.from_stat(os.lstat(self.local(path)))
+
+    @errno_to_sftp
+    def open(self, path, flags, attr):
+        fd = os.open(self.local(path), flags, 0o644)
+        if flags & os.O_WRONLY:
+            mode = 'ab' if flags & os.O_APPEND else 'wb'
+        elif flags & os.O_RDWR:
+            mode = 'a+b' if flags & os.O_APPEND else 'r+b'
+        else:
+            mode = 'rb'
+        handle = FileHandle(flags)
+        handle.filename = path
+        handle.readfile = handle.writefile = os.fdopen(fd, mode)
+        return handle
+
+    @errno_to_sftp
+    def remove(self, path):
+        os.remove(self.local(path))
+        return SFTP_OK
+
+    @errno_to_sftp
+    def rename(self, oldpath, newpath):
+        if os.path.exists(self.local(newpath)):
+            return SFTPServer.convert_errno(17)
+        os.rename(self.local(oldpath), self.local(newpath))
+        return SFTP_OK
+
+    @errno_to_sftp
+    def posix_rename(self, oldpath, newpath):
+        os.replace(self.local(oldpath), self.local(newpath))
+        return SFTP_OK
+
+    @errno_to_sftp
+    def mkdir(self, path, attr):
+        os.mkdir(self.local(path))
+        return SFTP_OK
+
+    @errno_to_sftp
+    def rmdir(self, path):
+        os.rmdir(self.local(path))
+        return SFTP_OK
+
+    @errno_to_sftp
+    def chattr(self, path, attr):
+        if attr.st_atime is not None and attr.st_mtime is not None:
+            os.utime(self.local(path), (attr.st_atime, attr.st_mtime))
+        return SFTP_OK
+
+
+class Server(paramiko.ServerInterface):
+    def __init__(self, root, allow_exec):
+        self.root = root
+        self.allow_exec = allow_exec
+
+    def check_auth_password(self, username, password):
+        if (username, password) == (USER, PASSWORD):
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        ''' only sha256sum is understood '''
+        args = command.decode().split(' ', 1)
+        if not self.allow_exec or args[0] != 'sha256sum' or len(args) < 2:
+            return False
+        path = self.root + args[1].strip("'")
+        threading.Thread(target=self.sha256sum, args=(channel, path),
+                         daemon=True).start()
+        return True
+
+    def sha256sum(self, channel, path):
+        try:
+            with open(path, 'rb') as fh:
+                channel.sendall(
+                    f'{sha256(fh.read()).hexdigest()}  {path}\n'.encode())
+            channel.send_exit_status(0)
+        except OSError:
+            channel.send_exit_status(1)
+        channel.close()
+
+
+class StandInServer:
+    ''' serves root over SFTP on localhost until stopped '''
+
+    def __init__(self, root, port=0, allow_exec=True):
+        self.root = os.path.abspath(root)
+        self.allow_exec = allow_exec
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', port))
+        self.port = self.sock.getsockname()[1]
+        self.transports = []
+        self.running = False
+
+    def start(self):
+        self.sock.listen(5)
+        self.running = True
+        threading.Thread(target=self.serve, daemon=True).start()
+        return self
+
+    def serve(self):
+        while self.running:
+            try:
+                client, _ = self.sock.accept()
+            except OSError:
+                break
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self.host_key)
+            transport.set_subsystem_handler(
+                'sftp', SFTPServer, DirectoryInterface)
+            transport.start_server(
+                server=Server(self.root, self.allow_exec))
+            self.transports.append(transport)
+
+    def drop_connections(self):
+        ''' simulates a lost link '''
+        for transport in self.transports:
+            transport.close()
+        self.transports = []
+
+    def stop(self):
+        self.running = False
+        self.drop_connections()
+        self.sock.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] != 'test':
+        root = sys.argv[1]
+        port = int(sys.argv[2]) if len(sys.argv) > 2 else 2222
+        server = StandInServer(root, port).start()
+        print(f'Serving {server.root} on 127.0.0.1:{server.port} '
+              f'({USER}/{PASSWORD}). Press Ctrl+C to stop.')
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.stop()
+        sys.exit()
+
+    # self test of the bridge's SFTP session: python -m ... test
+    import tempfile
+    from core.io.sftp import SFTPSession, UnknownHostError
+
+    with tempfile.TemporaryDirectory() as root, \
+            tempfile.TemporaryDirectory() as local:
+        known_hosts = f'{local}/ssh/known_hosts'
+        for allow_exec in (True, False):
+            server = StandInServer(root, allow_exec=allow_exec).start()
+            # unknown hosts are rejected, or trusted once and recorded
+            session = SFTPSession('127.0.0.1', USER, PASSWORD,
+                                  port=server.port, backoff=(0.1, 1),
+                                  known_hosts=known_hosts)
+            try:
+                session.connect(attempts=3)
+                assert False, 'unknown host accepted'
+            except UnknownHostError:
+                pass
+            session.accept_new_host = True
+            session.connect(attempts=3)
+            session.accept_new_host = False
+            session.connect(attempts=3)
+            src = f'{local}/test.zss'
+            with open(src, 'wb') as fh:
+                fh.write(os.urandom(100000))
+            session.makedirs('/snapshots/003')
+            assert session.put(src, '/snapshots/003/test.zss')
+            assert not session.put(src, '/snapshots/003/test.zss')
+            with open(src, 'ab') as fh:
+                fh.write(b'changed')
+            server.drop_connections()
+            assert not session.is_alive()
+            assert session.put(src, '/snapshots/003/test.zss')
+            assert not os.path.exists(f'{root}/snapshots/003/test.zss.tmp')
+            assert session.get('/snapshots/003/test.zss', src + '.back')
+            assert not session.get('/snapshots/003/missing.zss', src)
+            with open(src, 'rb') as a, open(src + '.back', 'rb') as b:
+                assert a.read() == b.read()
+            session.close()
+            # a known host presenting another key is rejected
+            server.host_key = paramiko.RSAKey.generate(2048)
+            try:
+                session.connect(attempts=3)
+                assert False, 'changed host key accepted'
+            except paramiko.BadHostKeyException:
+                pass
+            session.close()
+            server.stop()
+            os.remove(f'{root}/snapshots/003/test.zss')
+        print('ok')
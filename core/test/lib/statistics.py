@@ -0,0 +1,81 @@
+import tempfile
+from core.audio.sequencer import Sequencer
+
+# Cached statistics of the sequencer: edits made anywhere (also directly
+# in the library, followed by a save or an export of the RIFF data) must
+# show up in the next statistics, and collecting them must not clear the
+# modified flag of the library.
+# usage: python -m core.test.lib.statistics
+
+seq = Sequencer()
+seq.initialize(scan=False)
+ls = seq.libseq
+failures = 0
+
+
+def check(name, condition):
+    global failures
+    if not condition:
+        failures += 1
+        print(f'FAILED: {name}')
+
+
+def add_pattern(sequence, note):
+    ''' a pattern with a note at the start of a sequence of bank 1,
+        edited in the library directly (not through the sequencer) '''
+    pattern = ls.createPattern()
+    ls.addPattern(1, sequence, 0, 0, pattern, True)
+    ls.selectPattern(pattern)
+    ls.addNote(0, note, 100, 1.0)
+    return pattern
+
+
+seq.get_statistics()
+before = seq.pattern_count
+
+with tempfile.TemporaryDirectory() as folder:
+    add_pattern(0, 60)
+    seq.save_file(file_path=f'{folder}/test.zss')
+    seq.get_statistics()
+    check('edit, save, statistics', seq.pattern_count == before + 1)
+
+    add_pattern(1, 62)
+    seq.get_riff_data()
+    seq.get_statistics()
+    check('edit, export, statistics', seq.pattern_count == before + 2)
+
+    seq.pattern.select(add_pattern(2, 64))
+    seq.pattern.reset()
+    seq.get_statistics()
+    check('edit, statistics', seq.pattern_count == before + 2)
+
+    seq.pattern.add_notes([[0, 67, 100, 1]], transpose=0)
+    check('statistics keep the modified flag', ls.isModified())
+    seq.get_statistics()
+    check('pattern manager edit, statistics',
+          seq.pattern_count == before + 3)
+    check('statistics keep the modified flag', ls.isModified())
+
+    seq.save_file(file_path=f'{folder}/test.zss')
+    check('saving clears the modified flag', not ls.isModified())
+    seq.get_statistics()
+    check('statistics after saving', seq.pattern_count == before + 3 and
+          not ls.isModified())
+    usage = seq.usage
+    seq.get_statistics()
+    check('statistics kept without changes', seq.usage is usage)
+
+    ls.removePattern(1, 0, 0, 0)
+    seq.save_file(file_path=f'{folder}/test.zss')
+    seq.get_statistics()
+    check('removed pattern, save, statistics',
+          seq.pattern_count == before + 2)
+
+    seq.load_file(folder, 'test.zss')
+    seq.get_statistics()
+    check('load, statistics', seq.pattern_count == before + 2)
+    ls.removePattern(1, 1, 0, 0)
+    seq.get_statistics()
+    check('removed pattern, statistics', seq.pattern_count == before + 1)
+
+print(f'{failures} failures')
@@ -0,0 +1,86 @@
+import sys
+import random
+from core.lib.tracker import Note, TrackerPattern, TrackerPhrase
+
+# Property test of the note duration engine against the original
+# per-column loop on random phrases (notes, note-offs and empty cells),
+# and durations matching the note spacing at any lines per beat.
+# usage: python -m core.test.lib.tracker [phrases] [seed]
+
+
+def loop_durations(line_number, notes):
+    ''' the original implementation over a dense step x column dict '''
+    polyphony = max(len(cells) for cells in notes.values())
+    dense = {step: [None] * polyphony for step in range(line_number)}
+    for step, cells in notes.items():
+        for column, note in enumerate(cells):
+            dense[step][column] = note
+    result = {}
+    for column in range(polyphony):
+        last_step = 0
+        last_note = Note()
+        for step in range(line_number):
+            cell = dense[step][column]
+            if cell:
+                last_note.duration = step - last_step
+                last_note = cell
+                last_step = step
+        last_note.duration = step - last_step + 1
+    for step in range(line_number):
+        for column, note in enumerate(dense[step]):
+            if note is not None:
+                result[step, column] = note.duration
+    return result
+
+
+def random_phrase(rnd):
+    line_number = rnd.choice([1, 2, 16, 64, 512])
+    polyphony = rnd.randint(1, 12)
+    density = rnd.random()
+    notes = {}
+    for step in range(line_number):
+        if rnd.random() > density:
+            continue
+        notes[step] = [
+            Note(rnd.choice([-1, rnd.randint(12, 119)]), rnd.randint(0, 128))
+            if rnd.random() < density else None
+            for column in range(rnd.randint(1, polyphony))]
+    notes.setdefault(0, [None])
+    return line_number, notes
+
+
+phrases = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+rnd = random.Random(int(sys.argv[2]) if len(sys.argv) > 2 else 0)
+failures = 0
+
+for number in range(phrases):
+    line_number, notes = random_phrase(rnd)
+    pattern = TrackerPattern(line_number, notes)
+    single = TrackerPattern(line_number)
+    single.add_notes(notes)
+    expected = loop_durations(line_number, notes)
+    durations = {(step, column): note.duration
+                 for step, cells in pattern.notes.items()
+                 for column, note in enumerate(cells) if note is not None}
+    for step, column in expected:
+        single.calculate_duration_for(step, column)
+    stream = [[step, note.midi, note.velocity, expected[step, column]]
+              for step, cells in sorted(notes.items())
+              for column, note in enumerate(cells)
+              if note is not None and note.midi != -1]
+    if durations != expected or single.durations != pattern.durations or \
+            pattern.get_sequencer_stream() != stream:
+        failures += 1
+        print(f'MISMATCH in phrase {number}: {line_number} lines')
+
+line_number = 16
+notes = {0: [Note(60, 100), Note(64, 100)], 4: [Note(-1)], 10: [Note(67, 90)]}
+for lpb in ('4', '8', '2'):
+    phrase = TrackerPhrase(name='lpb', preset='', lpb=lpb,
+                           notes=lambda: notes, **{'#lines': line_number})
+    if phrase.pattern.get_sequencer_stream() != [
+            [0, 60, 100, 4], [0, 64, 100, 16], [10, 67, 90, 6]]:
+        failures += 1
+        print(f'MISMATCH in durations of a phrase of {lpb} lines per beat')
+
+print(f'{phrases} phrases, {failures} failures')
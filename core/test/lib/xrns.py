@@ -0,0 +1,38 @@
+import sys
+import time
+import tracemalloc
+from core.lib.xrns import XRNS
+
+# Compares the tree based and the incremental (iterparse) phrase extractor.
+# usage: python -m core.test.lib.xrns path/to/song.xrns [runs]
+
+
+def streams(project):
+    return [[phrase.pattern.get_sequencer_stream()
+             for phrase in group.phrases] for group in project.get_groups()]
+
+
+def measure(method, file_name, runs):
+    xrns = XRNS()
+    tracemalloc.start()
+    start = time.perf_counter()
+    for run in range(runs):
+        getattr(xrns, method)(file_name, standard_path=False)
+    elapsed = (time.perf_counter() - start) / runs
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return xrns.project, elapsed, peak
+
+
+file_name = sys.argv[1]
+runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+tree, tree_time, tree_peak = measure('load', file_name, runs)
+iterparse, iter_time, iter_peak = measure('stream', file_name, runs)
+
+print(f'groups: {len(tree.get_groups())}, '
+      f'phrases: {tree.get_total_phrases()}')
+print(f'load:   {tree_time * 1000:8.1f} ms  peak {tree_peak / 2**20:7.1f} MB')
+print(f'stream: {iter_time * 1000:8.1f} ms  peak {iter_peak / 2**20:7.1f} MB')
+print('identical' if tree.info == iterparse.info and
+      streams(tree) == streams(iterparse) else 'MISMATCH')
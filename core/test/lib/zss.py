@@ -0,0 +1,58 @@
+import io
+import os
+import json
+import base64
+import tempfile
+from core.lib.zss import RIFF_KEY, read_snapshot, write_snapshot
+
+# Snapshot codec: streamed writing must match the JSON encoder byte by
+# byte and reading must restore the RIFF data, including base64 wrapped
+# by base64.encodebytes (escaped line breaks in the JSON string).
+# usage: python -m core.test.lib.zss
+
+
+def encode(snapshot, riff_data, wrapped=False, **args):
+    ''' a snapshot as written by json (the previous writer) '''
+    snapshot = dict(snapshot)
+    b64 = base64.encodebytes(riff_data).decode('utf-8')
+    snapshot[RIFF_KEY] = b64 if wrapped else b64.replace('\n', '')
+    return json.dumps(snapshot, **args).encode()
+
+
+riffs = [b'', os.urandom(1), os.urandom(1000), os.urandom(3 * 64 * 1024 + 7)]
+snapshots = [
+    {},
+    {'index': 1, RIFF_KEY: '', 'layers': [{RIFF_KEY: 'nested'}]},
+    {'text': 'a "quoted" \\ string', 'name': 'éü', 'zoom': 1.5,
+     'flags': [True, False, None], 'empty': {}},
+]
+failures = 0
+with tempfile.TemporaryDirectory() as folder:
+    file_path = f'{folder}/test.zss'
+    for snapshot in snapshots:
+        for riff_data in riffs:
+            fh = io.BytesIO()
+            write_snapshot(fh, snapshot, riff_data)
+            variants = [(fh.getvalue(), 'streamed')]
+            if fh.getvalue() != encode(snapshot, riff_data):
+                failures += 1
+                print(f'MISMATCH in written snapshot {list(snapshot)}')
+            variants.append((encode(snapshot, riff_data, True), 'wrapped'))
+            variants.append((encode(snapshot, riff_data, True, indent=2),
+                             'indented'))
+            for data, name in variants:
+                with open(file_path, 'wb') as out:
+                    out.write(data)
+                expected = json.loads(data)
+                expected[RIFF_KEY] = ''
+                loaded, loaded_riff = read_snapshot(file_path)
+                keys, _ = read_snapshot(file_path, riff=False, keys=('zoom',))
+                if loaded != expected or list(loaded) != list(expected) or \
+                        loaded_riff != riff_data or \
+                        keys != {key: value for key, value in
+                                 expected.items() if key == 'zoom'}:
+                    failures += 1
+                    print(f'MISMATCH in {name} snapshot {list(snapshot)} '
+                          f'({len(riff_data)} bytes)')
+
+print(f'{failures} failures')